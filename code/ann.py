@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for finding the words closest to a vector without comparing it to the whole vocabulary: the unit word
+    vectors are clustered, and a search only looks at the words in the nprobe clusters closest to the vector
+    (an inverted file index). more clusters probed means better recall but slower searches
+
+    run "python ann.py [clusters]" once, after vectors.py, to build the index next to the memory-mapped model '''
+
+import sys
+import numpy
+
+DEFAULT_NPROBE = 8
+
+class IVF_Index(object):
+    ''' centroids holds one unit vector per cluster. the rows of the vector matrix in cluster c are
+        order[offsets[c]:offsets[c + 1]] '''
+    def __init__(self, centroids, order, offsets, nprobe=DEFAULT_NPROBE):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @staticmethod
+    def build(vectors, clusters=None, iterations=10, sample=50000, seed=0):
+        ''' clusters the unit vectors "vectors" with spherical k-means, trained on a sample of them
+            defaults to sqrt(number of vectors) clusters '''
+        rng = numpy.random.RandomState(seed)
+        clusters = clusters or int(numpy.sqrt(len(vectors)))
+        train = numpy.asarray(vectors[numpy.sort(rng.choice(len(vectors), min(sample, len(vectors)), replace=False))])
+        centroids = train[rng.choice(len(train), clusters, replace=False)].copy()
+        for iteration in range(iterations):
+            sums = numpy.zeros(centroids.shape)
+            numpy.add.at(sums, closest_centroids(train, centroids), train)
+            norms = numpy.sqrt((sums ** 2).sum(axis=1))
+            filled = norms > 0 # empty clusters keep their old centroid
+            centroids[filled] = sums[filled] / norms[filled, None]
+        assignment = closest_centroids(vectors, centroids)
+        order = numpy.argsort(assignment, kind='mergesort').astype(numpy.int32)
+        offsets = numpy.searchsorted(assignment[order], numpy.arange(clusters + 1))
+        return IVF_Index(centroids, order, offsets)
+
+    def search(self, vectors, query, topn, nprobe=None):
+        ''' the rows of vectors closest to the unit vector query among the nprobe clusters closest to it, as an array of
+            row numbers and an array of their similarities, best first '''
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probed = numpy.argpartition(-self.centroids.dot(query), nprobe - 1)[:nprobe]
+        # sorted, so that the rows are read from a memory-mapped file in order
+        candidates = numpy.sort(numpy.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probed]))
+        dists = vectors[candidates].dot(query)
+        count = min(topn, len(candidates))
+        if count == 0:
+            return candidates, dists
+        best = numpy.argpartition(-dists, count - 1)[:count]
+        best = best[numpy.argsort(-dists[best])]
+        return candidates[best], dists[best]
+
+    def save(self, path):
+        numpy.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @staticmethod
+    def load(path, nprobe=DEFAULT_NPROBE):
+        arrays = numpy.load(path)
+        return IVF_Index(arrays['centroids'], arrays['order'], arrays['offsets'], nprobe)
+
+def closest_centroids(vectors, centroids, chunk=10000):
+    ''' the index of the centroid closest to each of the vectors, a chunk of vectors at a time to bound memory '''
+    assignment = numpy.empty(len(vectors), dtype=numpy.int32)
+    for start in range(0, len(vectors), chunk):
+        assignment[start:start + chunk] = numpy.asarray(vectors[start:start + chunk]).dot(centroids.T).argmax(axis=1)
+    return assignment
+
+def recall(model, words, topn=10):
+    ''' the fraction of the exact most_similar results for words that model's index also finds, on average (1.0 is perfect)
+        for picking model.ann.nprobe '''
+    found = 0
+    for word in words:
+        exact = set(w for w, dist in model.most_similar(word, topn, exact=True))
+        approximate = set(w for w, dist in model.most_similar(word, topn))
+        found += len(exact & approximate)
+    return found / float(topn * len(words))
+
+if __name__ == '__main__':
+    from vectors import load_model
+    model = load_model()
+    print 'building index...'
+    index = IVF_Index.build(model.syn0norm, int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    index.save(model.prefix + '.ivf.npz') # for the model load_model found, shrunk or not
+    model.ann = index
+    print '...built, recall of the 10 nearest words:', recall(model, model.index2word[:1000:10])
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for making poems offline, from tweets downloaded beforehand rather than from mentions and live searches:
+    to backfill, to have poems ready for trending keywords, or to measure throughput on real data
+
+    python batch.py queries.jsonl poems.jsonl
+
+    every line of the input is a query and its tweets, e.g.
+        {"query": "coffee", "tweets": [{"id": 1, "text": "..."}, ...]}
+    (tweets can also be plain strings, and "id_str"/"full_text" are understood as in twitter's own JSON)
+    every line of the output is the poem for one input line, with the pair of tweets it came from, their similarity and how
+    long each stage took. the output is appended to, and input lines already in it are skipped, so an interrupted run can be
+    started again with the same arguments '''
+
+import os, json, time, argparse, multiprocessing
+from pomesic import Request, worker_pool
+from linguistics import load_resources
+from metrics import METRICS, Metrics, print_sink
+from twitter import Fake_Status
+import metrics
+
+class Dump_API(object):
+    ''' stands in for twitter, answering search with the downloaded tweets '''
+    def __init__(self, tweets):
+        self.tweets = tweets
+
+    def search(self, query, lang=None):
+        results = []
+        for number, tweet in enumerate(self.tweets):
+            if isinstance(tweet, basestring):
+                results.append(Fake_Status(number, tweet))
+            else:
+                results.append(Fake_Status(tweet.get('id_str', tweet.get('id', number)),
+                                           tweet.get('full_text', tweet.get('text', ''))))
+        return results
+
+def read_done(path):
+    ''' the input line numbers already in the output file at path
+        the last line of an interrupted run may be cut off, so it is ended to keep the next result on a line of its own '''
+    done = set()
+    if not os.path.exists(path):
+        return done
+    line = '\n'
+    with open(path) as output_file:
+        for line in output_file:
+            try:
+                done.add(json.loads(line)['line'])
+            except ValueError:
+                pass
+    if not line.endswith('\n'):
+        with open(path, 'a') as output_file:
+            output_file.write('\n')
+    return done
+
+def compose_line(numbered_line):
+    ''' makes the poem for one line of the input, in a worker process '''
+    number, line = numbered_line
+    started = time.time()
+    try:
+        record = json.loads(line)
+        query = record['query']
+        # stands in for the mention asking for query
+        mention = Fake_Status(number, '@PomeSic -query "' + query.replace('"', '') + '"', record.get('sender', 'batch'))
+        request = Request(mention, Dump_API(record.get('tweets', [])))
+        poem = request.get_poem() if not request.BAD_QUERY else None
+    except Exception, e:
+        return {'line': number, 'error': str(e), 'seconds': time.time() - started}, Metrics()
+    report = request.metrics.report()
+    return ({'line': number, 'query': query, 'poem': poem.split('\n')[1:] if poem is not None else None,
+             'pair': request.pair, 'score': request.score, 'cost': request.cost, 'seconds': time.time() - started,
+             'stages': dict((stage, histogram['sum']) for stage, histogram in report['stages'].iteritems())},
+            request.metrics)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str, help='JSON lines file of queries and their tweets')
+    parser.add_argument('output', type=str, help='JSON lines file to append the poems to')
+    parser.add_argument('-workers', type=int, default=multiprocessing.cpu_count(), help='processes composing poems')
+    parser.add_argument('-verbose', action='store_true', help='print the debug output of composing poems')
+    args = parser.parse_args()
+
+    metrics.VERBOSE = args.verbose
+    done = read_done(args.output)
+    if done:
+        print 'skipping the', len(done), 'lines already done'
+    # load before forking, so the workers share the resources
+    load_resources()
+    pool = worker_pool(args.workers)
+    started = time.time()
+    count = poems = 0
+    with open(args.input) as input_file:
+        todo = ((number, line) for number, line in enumerate(input_file) if line.strip() and not number in done)
+        with open(args.output, 'a') as output_file:
+            for count, (result, request_metrics) in enumerate(pool.imap(compose_line, todo, chunksize=4), 1):
+                output_file.write(json.dumps(result) + '\n')
+                output_file.flush() # so an interrupted run loses as little as possible
+                METRICS.merge(request_metrics)
+                if result.get('pair') is not None: # not the template
+                    poems += 1
+                if count % 100 == 0:
+                    print count, 'queries,', poems, 'poems,', '%.2f' % (count / (time.time() - started)), 'queries per second'
+    pool.close()
+    pool.join()
+    print count, 'queries,', poems, 'poems in', '%.1f' % (time.time() - started), 's'
+    print_sink(METRICS.report())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for timing the expensive parts of composing a poem without the real twitter model, enchant, wordnet or twitter
+    it makes up a small lexicon (word vectors grouped into topics, pronunciations built from syllables, synonyms from the same
+    topic), installs it in place of the lexical resources, and writes the timings as JSON so runs on different versions can
+    be compared
+
+    python bench.py -output new.json -baseline old.json '''
+
+import os, time, json, random, argparse, tempfile, subprocess, shutil
+import numpy
+import linguistics
+from linguistics import (hard_string_similarity, tweet_similarity_matrix, get_rhymes, best_rhyme, make_same_syl_count,
+                         normalize_word, normalize_words, build_synonym_options, build_rhyme_index, build_spelling_index)
+from vectors import Mapped_Model
+from phonology import Phone_Store
+from cache import LRU_Cache, Disk_Cache
+from pomesic import Request
+from twitter import Fake_Status
+import metrics
+
+ONSETS = [('b', ['B']), ('d', ['D']), ('k', ['K']), ('l', ['L']), ('m', ['M']), ('n', ['N']), ('p', ['P']), ('r', ['R']),
+          ('s', ['S']), ('t', ['T']), ('sh', ['SH']), ('gr', ['G', 'R'])]
+NUCLEI = [('a', 'AA'), ('e', 'EH'), ('i', 'IY'), ('o', 'OW'), ('u', 'UW'), ('ai', 'AY')]
+CODAS = [('', []), ('', []), ('n', ['N']), ('t', ['T']), ('st', ['S', 'T'])]
+
+class Synthetic_Lexicon(object):
+    ''' size pronounceable words in topics groups, with dimensions long vectors close to their topic's vector
+        every tenth word also has a slang spelling (the word with a z on the end) that is in the model but can't be
+        pronounced, to make normalize_word work '''
+    def __init__(self, size=5000, topics=50, dimensions=100, seed=0):
+        rng = random.Random(seed)
+        self.pronunciations = {}
+        while len(self.pronunciations) < size:
+            spelling, phonemes = '', []
+            for position in range(rng.choice([1, 1, 2, 2, 3])):
+                onset, nucleus, coda = rng.choice(ONSETS), rng.choice(NUCLEI), rng.choice(CODAS)
+                spelling += onset[0] + nucleus[0] + coda[0]
+                phonemes += onset[1] + [nucleus[1] + ('1' if position == 0 else '0')] + coda[1]
+            self.pronunciations[spelling] = [phonemes]
+        self.words = sorted(self.pronunciations)
+        self.slang = [word + 'z' for word in self.words[::10]]
+        self.topic = dict((word, rng.randrange(topics)) for word in self.words)
+        self.topic.update((word + 'z', self.topic[word]) for word in self.words[::10])
+        self.by_topic = {}
+        for word in self.words:
+            self.by_topic.setdefault(self.topic[word], []).append(word)
+        # synonyms are a few other words from the same topic
+        self.synonyms = dict((word, rng.sample(self.by_topic[self.topic[word]], min(8, len(self.by_topic[self.topic[word]]))))
+                             for word in self.words)
+        nrng = numpy.random.RandomState(seed)
+        centers = nrng.randn(topics, dimensions)
+        self.model_words = self.words + self.slang
+        vectors = numpy.array([centers[self.topic[word]] for word in self.model_words]) + nrng.randn(len(self.model_words), dimensions)
+        self.vectors = (vectors / numpy.sqrt((vectors ** 2).sum(axis=1))[:, None]).astype(numpy.float32)
+        self.rng = rng
+
+    def tweet(self):
+        ''' a made up tweet: words from one topic, with the odd slang word '''
+        words = self.by_topic[self.rng.choice(self.by_topic.keys())]
+        tweet = []
+        for i in range(self.rng.randrange(4, 10)):
+            if self.rng.random() < 0.1:
+                tweet.append(self.rng.choice(self.slang))
+            else:
+                tweet.append(self.rng.choice(words))
+        return tweet
+
+    def install(self, directory):
+        ''' writes the vectors to directory as a memory-mapped model and makes linguistics use this lexicon '''
+        prefix = os.path.join(directory, 'synthetic')
+        numpy.save(prefix + '.npy', self.vectors)
+        with open(prefix + '.vocab', 'w') as vocab_file:
+            for word in self.model_words:
+                vocab_file.write(word + ' 1\n')
+        linguistics.TWITTER_MODEL.use(Mapped_Model(prefix))
+        linguistics.PHONE_DICT.use(Phone_Store(self.pronunciations))
+        linguistics.RHYME_INDEX.use(build_rhyme_index())
+        linguistics.SPELLING_INDEX.use(build_spelling_index())
+        linguistics.SYNONYM_INDEX.use(dict((word, build_synonym_options(word, self.synonyms[word])) for word in self.words))
+        linguistics.NORMAL_CACHE = LRU_Cache(50000)
+        linguistics.NORMAL_DISK_CACHE = Disk_Cache(os.path.join(directory, 'normalized.sqlite'), 'normalized')
+
+class Fake_API(object):
+    ''' answers search with tweets made up by lexicon '''
+    def __init__(self, lexicon, count):
+        self.lexicon = lexicon
+        self.count = count
+
+    def search(self, query, lang=None):
+        return [Fake_Status(i, ' '.join(self.lexicon.tweet())) for i in range(self.count)]
+
+def timed(results, name, n, function, calls):
+    ''' calls function() "calls" times and adds how long it took to results, n is the size of the problem '''
+    start = time.time()
+    for i in range(calls):
+        function()
+    seconds = time.time() - start
+    results.append({'benchmark': name, 'n': n, 'calls': calls, 'seconds': seconds, 'per_call': seconds / calls})
+    print '%-28s n=%-5d %10.6f s per call' % (name, n, seconds / calls)
+
+def run(lexicon, directory, sizes):
+    ''' times every benchmark, returning a list of results '''
+    results = []
+    tweets = [lexicon.tweet() for i in range(max(sizes))]
+    pairs = [(lexicon.tweet(), lexicon.tweet()) for i in range(50)]
+
+    todo = iter(pairs)
+    timed(results, 'hard_string_similarity', 1, lambda: hard_string_similarity(*next(todo)), len(pairs))
+    for n in sizes:
+        timed(results, 'tweet_similarity_matrix', n, lambda: tweet_similarity_matrix(tweets[:n]), 3)
+    words = lexicon.words[::25]
+    todo = iter(words)
+    timed(results, 'get_rhymes', 1, lambda: get_rhymes(next(todo)), len(words))
+    todo = iter(zip(words, reversed(words)))
+    timed(results, 'best_rhyme', 1, lambda: best_rhyme(*next(todo)), len(words))
+    todo = iter(pairs)
+    timed(results, 'make_same_syl_count', 1, lambda: make_same_syl_count(*map(list, next(todo))), len(pairs))
+    slang = lexicon.slang[:100]
+    todo = iter(slang)
+    timed(results, 'normalize_word', 1, lambda: normalize_word(next(todo)), len(slang))
+    # misspellings: a letter of each word swapped for the next one
+    typos = [word[:len(word) // 2] + chr(ord(word[len(word) // 2]) + 1) + word[len(word) // 2 + 1:] for word in words]
+    todo = iter(typos)
+    timed(results, 'spelling correct', 1, lambda: linguistics.SPELLING_INDEX.correct(next(todo)), len(typos))
+    for n in sizes:
+        every_word = [word for tweet in tweets[:n] for word in tweet]
+        linguistics.NORMAL_CACHE = LRU_Cache(50000)
+        linguistics.NORMAL_DISK_CACHE = Disk_Cache(os.path.join(directory, 'normalized%d.sqlite' % n), 'normalized')
+        timed(results, 'normalize_words (cold)', n, lambda: normalize_words(every_word), 1)
+        timed(results, 'normalize_words (warm)', n, lambda: normalize_words(every_word), 1)
+    for n in sizes:
+        request = Request(Fake_Status(0, '@PomeSic -query "bench"', 'bench'),
+                          Fake_API(lexicon, n))
+        timed(results, 'Request.get_poem', n, request.get_poem, 1)
+    return results
+
+def compare(results, baseline):
+    ''' prints how the timings changed since the results in baseline '''
+    old = dict(((result['benchmark'], result['n']), result['per_call']) for result in baseline['results'])
+    print 'compared with ' + str(baseline.get('version')) + ':'
+    for result in results:
+        key = (result['benchmark'], result['n'])
+        if key in old and old[key] > 0:
+            print '%-28s n=%-5d %6.2fx' % (key[0], key[1], result['per_call'] / old[key])
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-output', type=str, help='file to write the timings to as JSON (default: print them)')
+    parser.add_argument('-baseline', type=str, help='JSON file from an earlier run to compare with')
+    parser.add_argument('-sizes', type=str, default='10,25,50,100', help='numbers of tweets to time the search results with')
+    parser.add_argument('-vocabulary', type=int, default=5000, help='number of words in the made up lexicon')
+    args = parser.parse_args()
+
+    metrics.VERBOSE = False # the pipeline's debug output would be timed too
+    directory = tempfile.mkdtemp()
+    print 'making up a lexicon...'
+    lexicon = Synthetic_Lexicon(args.vocabulary)
+    lexicon.install(directory)
+    print '...made'
+    try:
+        report = {'version': version(), 'vocabulary': args.vocabulary,
+                  'results': run(lexicon, directory, [int(size) for size in args.sizes.split(',')])}
+    finally:
+        shutil.rmtree(directory)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(report['results'], json.load(baseline_file))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=1)
+    else:
+        print json.dumps(report, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for remembering results that are expensive to work out, in memory (LRU_Cache, or TTL_Cache for results that
+    go stale) or on disk (Disk_Cache) '''
+
+import os, time, sqlite3, collections
+
+class LRU_Cache(object):
+    ''' dictionary holding at most maxsize items, forgetting the least recently used one when it is full
+        hits and misses count the lookups that found and didn't find something '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items[key] = value # back to the most recently used end
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+class TTL_Cache(object):
+    ''' like LRU_Cache, but items are also forgotten ttl seconds after they were put '''
+    def __init__(self, maxsize, ttl, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.items = collections.OrderedDict() # key to (value, when it expires)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value, expires = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires <= self.clock():
+            self.misses += 1
+            return default
+        self.items[key] = (value, expires)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = (value, self.clock() + self.ttl)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items and self.items[key][1] > self.clock()
+
+    def __len__(self):
+        return len(self.items)
+
+class Disk_Cache(object):
+    ''' string to string table kept in an SQLite file at path, so it survives restarts and can be shared between processes
+        each process opens its own connection, the first time it uses the cache '''
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.pid = None
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        # connections can't be shared with processes forked after they were opened
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30)
+            self.connection.text_factory = str
+            with self.connection:
+                self.connection.execute('CREATE TABLE IF NOT EXISTS ' + self.table + ' (key TEXT PRIMARY KEY, value TEXT)')
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        ''' returns a dict of the keys that are in the cache to their values '''
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), 500): # sqlite limits the number of parameters in one query
+            chunk = keys[start:start + 500]
+            query = 'SELECT key, value FROM ' + self.table + ' WHERE key IN (' + ', '.join('?' * len(chunk)) + ')'
+            found.update(self.connect().execute(query, chunk).fetchall())
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def put_many(self, items):
+        ''' adds every key, value pair in the dict "items", in one transaction '''
+        connection = self.connect()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO ' + self.table + ' VALUES (?, ?)', items.iteritems())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for running the bot as one long-lived process: a thread keeps polling for new mentions and queues them,
+    while the main thread answers them with the lexical resources already loaded '''
+
+import threading, signal, Queue
+
+PAGE_SIZE = 200 # the most mentions_timeline returns at once
+
+class Mention_Poller(threading.Thread):
+    ''' polls api.mentions_timeline for mentions newer than since_id and puts them on the queue "mentions", oldest first
+        waits min_interval seconds between polls while mentions keep coming, doubling the wait up to max_interval while
+        nothing does. stops when the event "stop" is set '''
+    def __init__(self, api, mentions, since_id=None, min_interval=15, max_interval=240, stop=None, max_pages=5):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.api = api
+        self.mentions = mentions
+        # id of the newest mention seen so far, so each poll only asks for newer ones
+        self.since_id = since_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.stop = stop or threading.Event()
+        self.max_pages = max_pages
+
+    def poll(self):
+        ''' queues every mention newer than since_id (see fetch_mentions) and returns how many there were '''
+        new = fetch_mentions(self.api, self.since_id, self.max_pages)
+        for mention in new:
+            self.mentions.put(mention)
+        if new:
+            self.since_id = new[-1].id
+        return len(new)
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                if self.poll():
+                    self.interval = self.min_interval
+                else:
+                    self.interval = min(self.interval * 2, self.max_interval)
+            except Exception, e:
+                print 'polling for mentions failed:', str(e)
+                self.interval = self.max_interval
+            self.stop.wait(self.interval)
+
+def fetch_mentions(api, since_id=None, max_pages=5, first_count=PAGE_SIZE):
+    ''' every mention newer than since_id, oldest first
+        pages back with max_id, so a burst bigger than one page isn't lost. with no since_id (the very first poll) only the
+        newest first_count are fetched, rather than the whole history '''
+    if since_id is None:
+        return sorted([mention for mention in api.mentions_timeline(count=first_count) if mention != None],
+                      key=lambda mention: mention.id)
+    new = []
+    max_id = None
+    for page_number in range(max_pages):
+        kwargs = {'count': PAGE_SIZE, 'since_id': since_id}
+        if max_id is not None:
+            kwargs['max_id'] = max_id
+        response = api.mentions_timeline(**kwargs)
+        page = [mention for mention in response if mention != None]
+        if not page:
+            break
+        new.extend(page)
+        # a page that isn't full is the last one, so there's no need to ask for the next
+        if len(response) < PAGE_SIZE:
+            break
+        max_id = min(mention.id for mention in page) - 1
+    new.sort(key=lambda mention: mention.id)
+    return new
+
+def drain(queue, timeout=1):
+    ''' everything on queue, waiting up to timeout seconds for the first item, or [] if nothing came '''
+    try:
+        items = [queue.get(timeout=timeout)]
+    except Queue.Empty:
+        return []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Queue.Empty:
+            return items
+
+def answer_batches(next_batch, answer_batch, stop, handle_signals=True):
+    ''' calls answer_batch(batch) with every batch of mentions next_batch() returns that isn't empty, until SIGINT/SIGTERM
+        (or setting "stop") - the batch being answered when the signal arrives is finished. next_batch shouldn't block for
+        more than a few seconds, so that the signal is noticed
+        handle_signals must be False when this isn't running in the main thread (e.g. in tests) '''
+    if handle_signals:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: stop.set())
+    while not stop.is_set():
+        batch = next_batch()
+        if not batch:
+            continue
+        try:
+            answer_batch(batch)
+        except Exception, e:
+            print 'failed to answer mentions:', str(e)
+
+def run_daemon(api, answer_batch, since_id=None, min_interval=15, max_interval=240, stop=None, handle_signals=True):
+    ''' answers mentions as the poller finds them by calling answer_batch(mentions) with everything queued so far, oldest first,
+        until SIGINT/SIGTERM (or setting "stop"), see answer_batches
+        the rest are left for the next run '''
+    stop = stop or threading.Event()
+    mentions = Queue.Queue()
+    poller = Mention_Poller(api, mentions, since_id, min_interval, max_interval, stop)
+    poller.start()
+    print 'waiting for mentions...'
+    answer_batches(lambda: drain(mentions), answer_batch, stop, handle_signals)
+    print 'shutting down...'
+    poller.join()
+    print '...stopped'
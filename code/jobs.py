@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for sharing the mentions between several bot processes (on one machine or many): one producer polls
+    twitter and puts each mention on a job queue, and any number of consumers lease jobs from it, compose the poems and
+    tweet them back
+    a lease hides its job from the other consumers for a while (the visibility timeout); if the consumer dies or takes too
+    long the lease runs out and someone else gets the job. a consumer only replies after finish() confirms its lease still
+    held and marked the job done, so a mention is answered at most once even when two consumers composed a poem for it
+
+    the queue is an SQLite file (SQLite_Queue) on one machine, or a redis server (Redis_Queue) shared by several:
+        python pomesic.py -daemon -produce -queue JOBS.sqlite
+        python pomesic.py -consume -queue redis://localhost:6379/0 '''
+
+import time, json, uuid, sqlite3, threading
+from twitter import Fake_Status
+from daemon import answer_batches
+
+MAX_ATTEMPTS = 3 # leases a job gets before it is given up on, so a mention that crashes consumers doesn't go round forever
+
+class Lease(object):
+    ''' a job leased by a consumer: the mention's id and payload, and the token that proves the lease is this one '''
+    def __init__(self, job_id, payload, token, attempts):
+        self.id = int(job_id)
+        self.payload = payload
+        self.token = token
+        self.attempts = attempts
+
+class SQLite_Queue(object):
+    ''' job queue in the SQLite file at path, which processes on the same machine can share
+        clock is there for tests '''
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS, clock=time.time):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.lock = threading.Lock()
+        # transactions are begun by hand, so a lease can take the write lock before looking for a job
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, payload TEXT, state TEXT,
+                                   token TEXT, visible REAL, attempts INTEGER, time REAL)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, visible)')
+
+    def transaction(self, sql, parameters):
+        ''' runs sql in a write transaction of its own, returning the cursor '''
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self.connection.execute(sql, parameters)
+                self.connection.execute('COMMIT')
+            except:
+                self.connection.execute('ROLLBACK')
+                raise
+        return cursor
+
+    def put(self, job_id, payload):
+        ''' adds the job job_id unless it was added before (whatever became of it), returning whether it was new '''
+        cursor = self.transaction('INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, NULL, 0, 0, ?)',
+                                  (int(job_id), json.dumps(payload), 'ready', self.clock()))
+        return cursor.rowcount == 1
+
+    def lease(self, timeout):
+        ''' the oldest job that is ready, or whose lease ran out, leased for timeout seconds, or None if there is none '''
+        now = self.clock()
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute('''SELECT id, payload, attempts FROM jobs WHERE (state = 'ready' OR
+                                                 (state = 'leased' AND visible < ?)) AND attempts < ? ORDER BY id LIMIT 1''',
+                                              (now, self.max_attempts)).fetchone()
+                if row is not None:
+                    self.connection.execute('''UPDATE jobs SET state = 'leased', token = ?, visible = ?, attempts = ?
+                                               WHERE id = ?''', (token, now + timeout, row[2] + 1, row[0]))
+                self.connection.execute('COMMIT')
+            except:
+                self.connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return Lease(row[0], json.loads(row[1]), token, row[2] + 1)
+
+    def finish(self, lease):
+        ''' marks the job done if lease still holds it, returning whether it did - only then may the reply be sent '''
+        now = self.clock()
+        cursor = self.transaction('''UPDATE jobs SET state = 'done', token = NULL, time = ? WHERE id = ? AND
+                                     state = 'leased' AND token = ? AND visible >= ?''', (now, lease.id, lease.token, now))
+        return cursor.rowcount == 1
+
+    def counts(self):
+        ''' how many jobs are ready, leased, done and given up on '''
+        now = self.clock()
+        with self.lock:
+            rows = self.connection.execute('''SELECT CASE WHEN state = 'done' THEN 'done' WHEN attempts >= ? AND
+                                              (state = 'ready' OR visible < ?) THEN 'failed' WHEN state = 'leased' AND
+                                              visible >= ? THEN 'leased' ELSE 'ready' END, COUNT(*) FROM jobs GROUP BY 1''',
+                                           (self.max_attempts, now, now)).fetchall()
+        return dict([('ready', 0), ('leased', 0), ('done', 0), ('failed', 0)] + rows)
+
+# the redis queue's operations are lua scripts so each is atomic on the server
+# KEYS: payloads, ready
+REDIS_PUT = '''
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then return 0 end
+redis.call('RPUSH', KEYS[2], ARGV[1])
+return 1
+'''
+# KEYS: ready, leased, tokens, attempts, payloads. ARGV: now, visible until, token, max attempts
+REDIS_LEASE = '''
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[1])) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('LPUSH', KEYS[1], id)
+end
+while true do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then return nil end
+    local attempts = redis.call('HINCRBY', KEYS[4], id, 1)
+    if attempts <= tonumber(ARGV[4]) then
+        redis.call('ZADD', KEYS[2], ARGV[2], id)
+        redis.call('HSET', KEYS[3], id, ARGV[3])
+        return {id, redis.call('HGET', KEYS[5], id), attempts}
+    end
+end
+'''
+# KEYS: leased, tokens, done. ARGV: id, token, now
+REDIS_FINISH = '''
+local visible = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not visible or tonumber(visible) < tonumber(ARGV[3]) or redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+return 1
+'''
+
+class Redis_Queue(object):
+    ''' job queue on a redis server, through client (redis.StrictRedis or anything with its register_script, llen, zcard
+        and hlen), under keys starting with name
+        the jobs are kept in a few keys: payloads (hash of id to payload, which also remembers every id ever added), ready
+        (list of ids, oldest first), leased (sorted set of ids by when their lease runs out), tokens and attempts (hashes
+        by id) and done (hash of id to when it was finished) '''
+    def __init__(self, client, name='pomesic', max_attempts=MAX_ATTEMPTS, clock=time.time):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.keys = dict((key, name + ':' + key) for key in ('payloads', 'ready', 'leased', 'tokens', 'attempts', 'done'))
+        self.put_script = client.register_script(REDIS_PUT)
+        self.lease_script = client.register_script(REDIS_LEASE)
+        self.finish_script = client.register_script(REDIS_FINISH)
+
+    def put(self, job_id, payload):
+        return self.put_script(keys=[self.keys['payloads'], self.keys['ready']],
+                               args=[int(job_id), json.dumps(payload)]) == 1
+
+    def lease(self, timeout):
+        now = self.clock()
+        token = uuid.uuid4().hex
+        leased = self.lease_script(keys=[self.keys[key] for key in ('ready', 'leased', 'tokens', 'attempts', 'payloads')],
+                                   args=[repr(now), repr(now + timeout), token, self.max_attempts])
+        if leased is None:
+            return None
+        job_id, payload, attempts = leased
+        return Lease(job_id, json.loads(payload), token, int(attempts))
+
+    def finish(self, lease):
+        return self.finish_script(keys=[self.keys[key] for key in ('leased', 'tokens', 'done')],
+                                  args=[lease.id, lease.token, repr(self.clock())]) == 1
+
+    def counts(self):
+        ''' how many jobs are waiting (ready, or leased and not yet noticed to have run out), leased and done '''
+        return {'ready': self.client.llen(self.keys['ready']), 'leased': self.client.zcard(self.keys['leased']),
+                'done': self.client.hlen(self.keys['done'])}
+
+def open_queue(url, max_attempts=MAX_ATTEMPTS):
+    ''' the queue at url: redis://host:port/db for a Redis_Queue (needs the redis package), anything else is the path of an
+        SQLite_Queue '''
+    if url.startswith('redis://'):
+        import redis
+        return Redis_Queue(redis.StrictRedis.from_url(url), max_attempts=max_attempts)
+    return SQLite_Queue(url, max_attempts)
+
+# ---- the mentions on the queue ----
+
+def queued_mention(lease):
+    ''' stands in for the mention a lease's job was made from, with the lease as its .lease '''
+    mention = Fake_Status(lease.id, lease.payload['text'], lease.payload['screen_name'])
+    mention.lease = lease
+    return mention
+
+def enqueue(queue, mentions):
+    ''' puts mentions on queue, returning how many weren't on it already '''
+    return sum(queue.put(mention.id, {'text': mention.text, 'screen_name': mention.author.screen_name})
+               for mention in mentions)
+
+def run_consumer(queue, answer_batch, batch_size=4, lease_time=300, idle=5, stop=None, handle_signals=True):
+    ''' leases up to batch_size jobs at a time from queue and calls answer_batch with them as queued_mentions, until
+        SIGINT/SIGTERM (or setting "stop", see answer_batches), waiting idle seconds whenever the queue is empty
+        lease_time has to be comfortably longer than answering a batch takes, or the jobs will be leased again meanwhile
+        (they would still only be answered once, see finish). a job whose poem failed is tried again when its lease runs out '''
+    stop = stop or threading.Event()
+    def lease_batch():
+        batch = []
+        try:
+            while len(batch) < batch_size:
+                lease = queue.lease(lease_time)
+                if lease is None:
+                    break
+                batch.append(queued_mention(lease))
+        except Exception, e:
+            print 'leasing jobs failed:', str(e)
+        if not batch:
+            stop.wait(idle)
+        return batch
+    print 'waiting for jobs...'
+    answer_batches(lease_batch, answer_batch, stop, handle_signals)
+    print '...stopped'
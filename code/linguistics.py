@@ -3,12 +3,17 @@
 
 ''' This file is for interacting with nltk, computing semantic similarity measures of sentences, and everything linguistically related '''
 
-import enchant
+import re, time
 import nltk
 from nltk.corpus import cmudict, wordnet
-import gensim
+import numpy
+import cPickle
 from other import int2word
-from nltk.metrics import edit_distance
+from resources import Lazy_Resource
+from vectors import load_model
+from phonology import load_phone_store
+from cache import LRU_Cache, Disk_Cache
+from spelling import Spelling_Index, load_spelling_index, edit_distance
 
 # ------------------------------------------------- RHYME MANIPULATION -----------------------------------------------------
 ''' CONSIDER CHANGING HOW RHYMING WORKS, SO THAT YOU GET THE MOST SIMILAR WORDS TO BOTH, AND NAVIGATE DOWN IN THE SIMILAIRTY
@@ -20,40 +25,137 @@ def is_rhyming_pair(phon1, phon2):
         vowel_idx += 1
     return phon1[-vowel_idx:] == phon2[-vowel_idx:]
 
+def rhyme_key(phonemes):
+    ''' the phonemes from the last vowel of the word until the end, joined into one string
+        two words rhyme (in the sense of is_rhyming_pair) exactly when their rhyme keys are equal
+        raises IndexError if there is no vowel, like is_rhyming_pair '''
+    vowel_idx = 1
+    while not phonemes[-vowel_idx][-1].isdigit():
+        vowel_idx += 1
+    return ' '.join(phonemes[-vowel_idx:])
+
+def word_rhyme_key(word):
+    ''' rhyme_key(get_phonemes(word)), looked up in PHONE_DICT when word is in it '''
+    if word in PHONE_DICT:
+        return PHONE_DICT.rhyme_key(word)
+    return rhyme_key(get_phonemes(word))
+
 def change_both(word1, word2):
-    syns_1 = get_synonyms(word1)
-    syns_2 = get_synonyms(word2)
+    ''' finds the pair of synonyms of word1 and word2 that rhyme and are closest to them on average, returned as
+        ((synonym1, synonym2), score). synonyms of word2 are grouped by rhyme key, so only rhyming pairs are looked at '''
+    syns_2 = {} # rhyme key to the synonyms of word2 with that key and their scores
+    for alternatives in synonym_options(word2).values():
+        for syn_2, score_2 in alternatives:
+            try:
+                syns_2.setdefault(word_rhyme_key(syn_2), []).append((syn_2, score_2))
+            except IndexError: # no vowel, can't rhyme
+                pass
     rhyming_pairs = []
-    for syn_1 in syns_1:
-        for syn_2 in syns_2:
-            if is_rhyming_pair(get_phonemes(syn_1), get_phonemes(syn_2)):
-                rhyming_pairs.append((syn_1, syn_2))
-    rhyming_pairs = [(pair, (TWITTER_MODEL.similarity(pair[0], word1) + TWITTER_MODEL.similarity(pair[1], word2)) / 2.0) for pair in rhyming_pairs]
+    for alternatives in synonym_options(word1).values():
+        for syn_1, score_1 in alternatives:
+            try:
+                key = word_rhyme_key(syn_1)
+            except IndexError:
+                continue
+            for syn_2, score_2 in syns_2.get(key, []):
+                rhyming_pairs.append(((syn_1, syn_2), (score_1 + score_2) / 2.0))
     rhyming_pairs.sort(key=lambda x: x[1], reverse = True)
     return rhyming_pairs[0]
 
 def get_rhymes(word):
-    ''' Returns a list of words in the twitter corpus rhyming with word "word"
+    ''' Returns a set of words in the twitter corpus rhyming with word "word"
     Two words rhyme when all phonemes, beginning with the last vowel in the word, until the end of the word, are the same
-    Idea found here: http://kashthealien.wordpress.com/2013/06/15/213/ - Modified to only search words in twitter corpus '''
-    pron_of_word = get_phonemes(word)
-    rhymes = set()
-    for opt in TWITTER_MODEL.vocab.keys():
-        if opt in PHONE_DICT and opt != word:
-            pron_of_opt = get_phonemes(opt)
-            if is_rhyming_pair(pron_of_word, pron_of_opt):
-                rhymes.add(opt)
+    Idea found here: http://kashthealien.wordpress.com/2013/06/15/213/ - Modified to only search words in twitter corpus
+    Looks up the bucket of word's rhyme key in RHYME_INDEX instead of scanning the whole vocabulary '''
+    rhymes = set(RHYME_INDEX.get(word_rhyme_key(word), []))
+    rhymes.discard(word)
     return rhymes
 
-def best_rhyme(start, goal):
-    ''' Calls get_rhymes(start) and ranks the rhymes by similarity to goal '''
-    result = [(goal, word_similarity(goal, start)) for goal in get_rhymes(start)]
+def build_rhyme_index():
+    ''' maps the rhyme key of every word in the twitter corpus that is also in PHONE_DICT to the list of those words '''
+    index = {}
+    for word in TWITTER_MODEL.vocab:
+        if word in PHONE_DICT:
+            try:
+                index.setdefault(PHONE_DICT.rhyme_key(word), []).append(word)
+            except IndexError: # no vowel, can't rhyme with anything
+                pass
+    return index
+
+def load_rhyme_index(path):
+    ''' loads the rhyme index saved at path, or builds it and saves it there if it is missing or was built
+        from a different twitter corpus (delete the file to force a rebuild) '''
+    try:
+        with open(path, 'rb') as index_file:
+            vocab_size, index = cPickle.load(index_file)
+        if vocab_size == len(TWITTER_MODEL.vocab):
+            return index
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        pass
+    index = build_rhyme_index()
+    with open(path, 'wb') as index_file:
+        cPickle.dump((len(TWITTER_MODEL.vocab), index), index_file, cPickle.HIGHEST_PROTOCOL)
+    return index
+
+def has_rhymes(word):
+    ''' whether get_rhymes(word) finds anything, without building the set '''
+    try:
+        bucket = RHYME_INDEX.get(word_rhyme_key(word), [])
+    except IndexError:
+        return False
+    return len(bucket) > 1 or (len(bucket) == 1 and bucket[0] != word)
+
+def synonym_rhyme_keys(word):
+    ''' the rhyme keys of word's synonyms - change_both can only work for two words whose sets share a key '''
+    keys = set()
+    if not word:
+        return keys
+    for alternatives in synonym_options(word).values():
+        for synonym, score in alternatives:
+            try:
+                keys.add(word_rhyme_key(synonym))
+            except IndexError:
+                pass
+    return keys
+
+class Rhyme_Feasibility:
+    ''' cheap check of which pairs of lines make_rhyme could possibly work for, given their last words: it needs a rhyme
+        for one of them (best_rhyme), or rhyming synonyms for both (change_both), and fails otherwise
+        the synonyms are only looked at for pairs where neither word has rhymes, and once per word '''
+    def __init__(self, last_words):
+        self.last_words = last_words
+        self.rhymable = [has_rhymes(word) for word in last_words]
+        self.keys = [] # rhyme key of each word, None if it has no vowel
+        for word in last_words:
+            try:
+                self.keys.append(word_rhyme_key(word))
+            except IndexError:
+                self.keys.append(None)
+        self.synonym_keys = {}
+
+    def feasible(self, one, two):
+        if self.rhymable[one] or self.rhymable[two]:
+            return True
+        for i in (one, two):
+            if not i in self.synonym_keys:
+                self.synonym_keys[i] = synonym_rhyme_keys(self.last_words[i])
+        return bool(self.synonym_keys[one] & self.synonym_keys[two])
+
+def best_rhyme(start, goal, exclude=()):
+    ''' Calls get_rhymes(start) and ranks the rhymes by similarity to goal, leaving out the words in exclude '''
+    result = [(rhyme, word_similarity(goal, rhyme)) for rhyme in get_rhymes(start) if not rhyme in exclude]
     result.sort(reverse=True, key = lambda x: x[1])
     return result[0]
 
 def make_rhyme(tweet1, tweet2):
     ''' Tries to make tweet1 rhyme with tweet2, then tweet2 with tweet1, then both, choses the least 'costly' option
     fails if it is impossible '''
+    tweet1, tweet2, score = make_rhyme_scored(tweet1, tweet2)
+    return (tweet1, tweet2)
+
+def make_rhyme_scored(tweet1, tweet2):
+    ''' make_rhyme, also returning the similarity of the new rhyming word(s) to the ones they replace, as
+        (tweet1, tweet2, score) - the higher the better. raises ValueError if no option worked '''
     try: # evaluate the cost of making tweet1 rhyme with tweet2
         chng_second = best_rhyme(tweet1[-1], tweet2[-1]) 
     except: # will fail if there is no rhyming word
@@ -68,132 +170,29 @@ def make_rhyme(tweet1, tweet2):
         chng_both = (None, 0)
     # If changing the first is better, do it.
     if chng_first[1] > chng_second[1]:
-        if chng_both[1] > chng_first[1]:
-            tweet1[-1] = chng_both[0][0]
-            tweet2[-1] = chng_both[0][1]
-        else:
-            tweet1[-1] = chng_first[0]
+        chosen = chng_both if chng_both[1] > chng_first[1] else chng_first
     else:
-        if chng_both[1] > chng_second[1]:
-            tweet1[-1] = chng_both[0][0]
-            tweet2[-1] = chng_both[0][1]
-        else:
-            tweet2[-1] = chng_second[0]
-    return (tweet1, tweet2)
+        chosen = chng_both if chng_both[1] > chng_second[1] else chng_second
+    if chosen[0] is None:
+        raise ValueError('no rhyme for ' + tweet1[-1] + ' and ' + tweet2[-1])
+    if chosen is chng_both:
+        tweet1[-1] = chng_both[0][0]
+        tweet2[-1] = chng_both[0][1]
+    elif chosen is chng_first:
+        tweet1[-1] = chng_first[0]
+    else:
+        tweet2[-1] = chng_second[0]
+    return (tweet1, tweet2, chosen[1])
 
 # ----------------------------------------------- SYLLABLE MANIPULATION ----------------------------------------------------
-def synonym_with_syllables(word, n_syl):
-    ''' synonym_with_syllables(word, n_syl), which returns a tuple in the format (alternative, score), that contains
-    the semantically closest alternative to word with number of syllables n_syl and the score (semantic distance between them)
-    if the word is 1 syllable, it returns (None, float('inf'))
-    CHOICES: use wordnet synonyms, or rank similarity using gensim and select first one to have correct number of syllables '''
-    if n_syl == 0:
-        return (None, 0)
-    # print '62,',word
-    options = get_synonyms(word)
-    works = filter(lambda x: nsyl_word(x) == n_syl, options)
-    result = [(opt, word_similarity(word, opt)) for opt in works]
-    result.sort(reverse=True, key = lambda x: x[1])
-    try:
-        return result[0]
-    except:
-        return (None, float('inf'))
-
-class Syllable_Manipulator:
-    ''' changed tweet accessible as sm.sent, score of change accessible as sm.final_score '''
-    def __init__(self):
-        self.sent = None
-        # Keeps track of words seen in self.sent to the result of calling synonym_with_syllables to avoid re-computing
-        self.easy_reductions = {}   # maps word to syllable count of word - 1
-        self.easy_increases = {}    # maps word to syllable count of word + 1
-        # Keeps track of words to syllable counts to avoid recounting
-        self.easy_syllables = {}
-        # How many syllables I have
-        self.current = None
-        # How many syllables I want
-        self.desired = None
-        # To avoid returning anything
-        self.final_score = 0
-
-    def reset(self, list_of_words, final_nsyl):
-        ''' change the current sentence and goal of the Syllable_Manipulator 
-            preferable to reinitializing it because easy_increases/reductions are cached '''
-        self.sent = list_of_words
-        self.current = self.total_syllable_count()
-        self.desired = final_nsyl
-        self.final_score = 0
-
-    def progress(self):
-        ''' add or subtract a syllable, depending on which is necessary '''
-        if self.current < self.desired:
-            self.add_syllable()
-        elif self.current > self.desired:
-            self.subtract_syllable()
-
-    def add_syllable(self):
-        ''' consider replacing each word with a word that is one more syllable, perform the least 
-            "costly" replacement defined by semantic distance 
-            CHOICE: what do i do when all words are one syllable? right now delete first, change to
-            delete "unimportant" one '''
-        for word in self.sent[:-1]:
-            if not word in self.easy_increases:
-                self.easy_increases[word] = synonym_with_syllables(word, self.syllable_count_of_word(word) + 1)
-        best_increase = None
-        best_score = 0
-        for word in self.sent[:-1]:
-            if self.easy_increases[word][1] > best_score:
-                best_increase = word
-                best_score = self.easy_increases[word][1]
-        if best_increase != None and self.easy_increases[best_increase][0] != None:
-            # print '113, sub:', best_increase, 'for', self.easy_increases[best_increase][0]
-            self.sent[self.sent.index(best_increase)] = self.easy_increases[best_increase][0]
-            self.final_score += 1 - self.easy_increases[best_increase][1]
-        else:
-            self.final_score = float('inf')
-
-    def subtract_syllable(self):
-        ''' consider replacing each word with a word that is one less syllable, perform the least 
-            "costly" replacement defined by semantic distance 
-            CHOICE: what do i do when all words are one syllable? right now delete first, change to
-            delete "unimportant" one '''
-        for word in self.sent[:-1]:
-            if not word in self.easy_reductions:
-                self.easy_reductions[word] = synonym_with_syllables(word, self.syllable_count_of_word(word) - 1)
-        best_reduction = None
-        best_score = 0
-        for word in self.sent[:-1]:
-            if self.easy_reductions[word][1] > best_score:
-                best_reduction = word
-                best_score = self.easy_reductions[word][1]
-        if best_reduction != None and self.easy_reductions[best_reduction][0] != None:
-            # print '129, sub:', best_reduction, 'for', self.easy_reductions[best_reduction][0]
-            self.sent[self.sent.index(best_reduction)] = self.easy_reductions[best_reduction][0]
-            self.final_score += 1 - self.easy_reductions[best_reduction][1]
-        else:
-            self.final_score = 10000
-            self.sent = self.sent[1:]
-
-    def syllable_count_of_word(self, word):
-        ''' use cached syllable counts or start from scratch to compute number of syllables in "word" '''
-        if word in self.easy_syllables:
-            return self.easy_syllables[w]
-        try:
-            return nsyl_word(word)
-        except:
-            return 1
-
-    def total_syllable_count(self):
-        '''' use cached syllable count or recounting syllables to determine the syllables in self.sent '''
-        total = 0
-        for word in self.sent:
-            total += self.syllable_count_of_word(word)
-        self.current = total
-        return total
-
 def nsyl_word(word):
-    ''' found here:http://stackoverflow.com/questions/405161/detecting-syllables-in-a-word '''
+    ''' found here:http://stackoverflow.com/questions/405161/detecting-syllables-in-a-word
+        precomputed in PHONE_DICT for the words in it '''
+    word = word.lower()
+    if word in PHONE_DICT:
+        return PHONE_DICT.syllable_count(word)
     tot = 0
-    for x in get_phonemes(word.lower()):
+    for x in get_phonemes(word):
         if x[-1].isdigit():
             tot += 1
     return tot
@@ -209,29 +208,82 @@ def nsyl_sent(sent):
     return total
 
 def make_same_syl_count(tweet1, tweet2):
-    ''' abstracts the usage of Syllable_Manipulator class – continues to add or subtract a syllable
-        until they are the same number of syllables '''
-    sm1 = Syllable_Manipulator()
-    sm1.reset(tweet1, nsyl_sent(tweet2))
-    sm2 = Syllable_Manipulator()
-    sm2.reset(tweet2, nsyl_sent(tweet1))
-    while sm1.total_syllable_count() != sm2.total_syllable_count():
-        # print sm1.sent
-        # print sm2.sent
-        prev_s1 = sm1.sent
-        prev_s2 = sm2.sent
-        sm1.progress()
-        sm2.progress()
-        # print sm1.final_score, sm2.final_score
-        if sm1.final_score < sm2.final_score:
-            sm1.reset(sm1.sent, nsyl_sent(prev_s2))
-            sm2.reset(prev_s2, sm1.current)
-        else:
-            sm1.reset(prev_s1, sm2.current)
-            sm2.reset(sm2.sent, nsyl_sent(prev_s1))
-        # print sm1.total_syllable_count()
-        # print sm2.total_syllable_count()
-    return sm1.sent, sm2.sent
+    ''' rewrites tweet1 and tweet2 to have the same number of syllables, see equalize_syllables '''
+    sent1, sent2, cost = equalize_syllables(tweet1, tweet2)
+    return sent1, sent2
+
+DELETE_COST = 10000       # cost of dropping a word, so it only happens when no synonyms can be used
+MAX_SYLLABLE_WORK = 20000 # most steps syllable_costs takes for one tweet
+
+def equalize_syllables(tweet1, tweet2, max_work=MAX_SYLLABLE_WORK):
+    ''' finds the cheapest rewrites of tweet1 and tweet2 that have the same number of syllables and returns them with their
+        total cost as (sent1, sent2, cost). each word can be kept, swapped for a synonym with a different syllable count
+        (costing 1 - similarity) or dropped; the last word is kept because it rhymes
+        raises ValueError if no syllable count can be reached by both tweets
+        the work is capped by max_work per tweet, so it can't go on forever like the greedy loop it replaced '''
+    (sent1, sent2), cost = equalize_lines([tweet1, tweet2], max_work)
+    return sent1, sent2, cost
+
+def equalize_lines(lines, max_work=MAX_SYLLABLE_WORK):
+    ''' equalize_syllables for any number of lines, returned as ([sent, ...], cost) '''
+    alternatives = [syllable_alternatives(line) for line in lines]
+    costs, steps = zip(*[syllable_costs(line_alternatives, max_work) for line_alternatives in alternatives])
+    common = [total for total in costs[0] if total > 0 and all(total in line_costs for line_costs in costs[1:])]
+    if not common:
+        raise ValueError('the tweets can not be given the same number of syllables')
+    total = min(common, key=lambda total: sum(line_costs[total] for line_costs in costs))
+    sents = [rebuild_sentence(line_alternatives, line_steps, total) for line_alternatives, line_steps in zip(alternatives, steps)]
+    return sents, sum(line_costs[total] for line_costs in costs)
+
+def syllable_alternatives(sent):
+    ''' for every word in sent, the list of (replacement, syllables, cost) it could become: itself for free, then the closest
+        synonym for every other syllable count, then None (dropping it) - the last word can only be kept '''
+    result = []
+    for position, word in enumerate(sent):
+        try:
+            n_syl = nsyl_word(word)
+        except:
+            n_syl = 1
+        options = [(word, n_syl, 0)]
+        if position < len(sent) - 1:
+            for other_n_syl, synonyms in synonym_options(word).iteritems():
+                if other_n_syl != n_syl and other_n_syl > 0 and synonyms:
+                    options.append((synonyms[0][0], other_n_syl, 1 - synonyms[0][1]))
+            options.append((None, 0, DELETE_COST))
+        result.append(options)
+    return result
+
+def syllable_costs(alternatives, max_work):
+    ''' dynamic programming over the words: the cheapest cost of reaching every total syllable count, as {total: cost}, and
+        for every word a dict of total to (total before this word, index of the option used) to rebuild the sentence from
+        once max_work steps have been taken, the remaining words are kept as they are '''
+    costs = {0: 0}
+    steps = []
+    work = 0
+    for options in alternatives:
+        if work >= max_work:
+            options = options[:1]
+        new_costs = {}
+        step = {}
+        for total, cost in costs.iteritems():
+            for i, (replacement, n_syl, option_cost) in enumerate(options):
+                work += 1
+                if not total + n_syl in new_costs or cost + option_cost < new_costs[total + n_syl]:
+                    new_costs[total + n_syl] = cost + option_cost
+                    step[total + n_syl] = (total, i)
+        costs = new_costs
+        steps.append(step)
+    return costs, steps
+
+def rebuild_sentence(alternatives, steps, total):
+    ''' follows the steps from syllable_costs back from total to get the words that were chosen '''
+    sent = []
+    for options, step in reversed(zip(alternatives, steps)):
+        total, i = step[total]
+        if options[i][0] != None:
+            sent.append(options[i][0])
+    sent.reverse()
+    return sent
 
 # ------------------------------------------------ TWEET NORMALIZATION -----------------------------------------------------
 def normalize_word(word):
@@ -239,7 +291,7 @@ def normalize_word(word):
         if it's a number, use a function found online to write out the number for phonetic ease
         if it's in the dictionary, just return it
         if it's in the twitter corpus, find a "normal" word that is contextually similar to it
-        if it's not in any of the above, spell correct it
+        if it's not in any of the above, spell correct it to a word in PHONE_DICT (with SPELLING_INDEX)
         if it can't be spell corrected, return it un-normalized '''
     if word.isdigit():
         return int2word(int(word))
@@ -251,17 +303,55 @@ def normalize_word(word):
         normalized_alternatives = []
         for option in TWITTER_MODEL.most_similar(word):
             if option[0] in PHONE_DICT:
-                normalized_alternatives.add(option[0])
+                normalized_alternatives.append(option[0])
         ranked_alts = sorted([(alt, edit_distance(word,alt)) for alt in normalized_alternatives], key=lambda x:x[1])
         # print 'twitter model used'
         return ranked_alts[0][0]
     except:
         pass
-    try:
-        # print 'spell checker used'
-        return ENGLISH_DICT.suggest(word)[0]
-    except:
-        return word
+    # print 'spell checker used'
+    return SPELLING_INDEX.correct(word) or word
+
+def normalize_words(words, deadline=None):
+    ''' returns a dict of every word in words to normalize_word(word), doing the work once per distinct word
+        the slow ones (neither numbers nor in PHONE_DICT) are remembered in NORMAL_CACHE, and in NORMAL_DISK_CACHE so
+        they are still known after a restart
+        once the time.time() deadline has passed, the slow words that are left are not normalized (they map to themselves,
+        and are counted in DEADLINE_SKIPS) - each can take a search of the whole twitter model '''
+    global DEADLINE_SKIPS
+    normalized = {}
+    missing = []
+    for word in set(words):
+        if word.isdigit() or word.lower() in PHONE_DICT:
+            normalized[word] = normalize_word(word)
+        elif word in NORMAL_CACHE:
+            normalized[word] = NORMAL_CACHE.get(word)
+        else:
+            missing.append(word)
+    NORMAL_CACHE.misses += len(missing)
+    if missing:
+        from_disk = NORMAL_DISK_CACHE.get_many(missing)
+        new = {}
+        for word in missing:
+            if word in from_disk:
+                continue
+            if deadline is not None and time.time() > deadline:
+                normalized[word] = word
+                DEADLINE_SKIPS += 1
+            else:
+                new[word] = normalize_word(word)
+        if new:
+            NORMAL_DISK_CACHE.put_many(new)
+        for word, normal in from_disk.items() + new.items():
+            NORMAL_CACHE.put(word, normal)
+            normalized[word] = normal
+    return normalized
+
+def normalization_stats():
+    ''' hit and miss counts of the normalization caches, to see how well they work, and how many words were left alone
+        because the deadline had passed '''
+    return {'memory_hits': NORMAL_CACHE.hits, 'memory_misses': NORMAL_CACHE.misses,
+            'disk_hits': NORMAL_DISK_CACHE.hits, 'disk_misses': NORMAL_DISK_CACHE.misses, 'deadline_skips': DEADLINE_SKIPS}
 
 # ----------------------------------------------- SIMILARITY OF STRINGS --------------------------------------------------
 def easy_string_similarity(tweet1, tweet2):
@@ -286,6 +376,29 @@ def hard_string_similarity(tweet1, tweet2):
     tot_average /= float(len(tweet1))
     return tot_average
 
+def tweet_similarity_matrix(tweets):
+    ''' computes hard_string_similarity for every pair of tweets at once, returned as a len(tweets) x len(tweets) numpy array
+        the sum of the cosine similarities of every word in tweet1 with every word in tweet2 is the dot product of the sums of
+        their unit word vectors, so every tweet is embedded once and all scores come from one matrix multiply
+        identical words score 0 in word_similarity rather than 1, so the number of identical word pairs is subtracted
+        words not in the twitter corpus have no vector, which gives them the same score of 0 '''
+    TWITTER_MODEL.init_sims()
+    vectors = TWITTER_MODEL.syn0norm
+    rows, columns, indices = [], [], []
+    word_columns = {} # in-corpus words of the tweets to their column in the word count matrix
+    for row, tweet in enumerate(tweets):
+        for word in tweet:
+            if word in TWITTER_MODEL.vocab:
+                rows.append(row)
+                columns.append(word_columns.setdefault(word, len(word_columns)))
+                indices.append(TWITTER_MODEL.vocab[word].index)
+    sums = numpy.zeros((len(tweets), vectors.shape[1]))
+    numpy.add.at(sums, rows, vectors[indices])
+    counts = numpy.zeros((len(tweets), len(word_columns)))
+    numpy.add.at(counts, (rows, columns), 1)
+    lengths = numpy.array([max(len(tweet), 1) for tweet in tweets], dtype=float)
+    return (sums.dot(sums.T) - counts.dot(counts.T)) / numpy.outer(lengths, lengths)
+
 def word_similarity(word1, word2):
     ''' get the similarity of 2 words - if they are the same, use the sameness penalty to discourage tweets from being identical
         otherwise use TWITTER_MODEL.similarity
@@ -301,7 +414,7 @@ def word_similarity(word1, word2):
 # ---------------------------------------------------- GET PHONEMES ---------------------------------------------------
 def get_phonemes(word):
     if word in PHONE_DICT:
-        return PHONE_DICT[word][0]
+        return PHONE_DICT.phonemes(word)
     else:
         ''' due to extreme difficulties installing a grapheme to phoneme converter, this will settle '''
         result = []
@@ -326,23 +439,101 @@ def get_synonyms(word):
                         synonyms.add(lem)
     return synonyms
 
+def synonym_options(word):
+    ''' the synonyms of word grouped by syllable count, each group a list of (synonym, word_similarity) tuples best first,
+        e.g. {1: [('dog', 0.7)], 2: [('puppy', 0.6), ('canine', 0.4)]}
+        looked up in SYNONYM_INDEX, words missing from it are worked out from wordnet and added '''
+    if not word in SYNONYM_INDEX:
+        SYNONYM_INDEX[word] = build_synonym_options(word)
+    return SYNONYM_INDEX[word]
+
+def build_synonym_options(word, synonyms=None):
+    ''' scores every synonym against word, see synonym_options - the synonyms come from wordnet (get_synonyms) unless
+        they are given '''
+    if synonyms is None:
+        synonyms = get_synonyms(word)
+    options = {}
+    for synonym in synonyms:
+        options.setdefault(nsyl_word(synonym), []).append((synonym, word_similarity(word, synonym)))
+    for alternatives in options.values():
+        alternatives.sort(reverse=True, key = lambda x: x[1])
+    return options
+
+def build_synonym_index():
+    ''' the synonym options of every word in the twitter corpus that is also in PHONE_DICT - slow, done offline '''
+    index = {}
+    for word in TWITTER_MODEL.vocab:
+        if word in PHONE_DICT:
+            index[word] = build_synonym_options(word)
+    return index
+
+def load_synonym_index(path):
+    ''' loads the synonym index saved at path, or starts an empty one (filled in as words are used) if there is none '''
+    try:
+        with open(path, 'rb') as index_file:
+            return cPickle.load(index_file)
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        return {}
+
 # ------------------------------------------------- OTHER ------------------------------------------------------------
+PUNCTUATION = ''',":-/!#|\~`<>][}{$%^&*()-_=+@';?.'''
+RETWEET = re.compile(r'^RT @\w+:?\s*') # what twitter puts in front of a retweet
+
 def remove_punctuation(string):
-    # print 'i got ' + string
-    s = string
-    for punc in ''',":-/!#|\~`<>][}{$%^&*()-_=+@';?.''':
-        s = s.replace(punc, '')
-    # print 'i return ' + s
-    return s.encode('ascii','ignore')
+    ''' drops non-ascii characters and PUNCTUATION, one pass each '''
+    return string.encode('ascii','ignore').translate(None, PUNCTUATION)
+
+def clean_tweet(text, max_length=65):
+    ''' turns the text of a tweet into the list of words used for poems, going over it once: drops a leading retweet marker,
+        punctuation and links, then keeps the longest run of words at the end that is at most max_length characters long '''
+    words = [word for word in remove_punctuation(RETWEET.sub('', text)).split() if not 'http' in word]
+    return last_words(words, max_length)
+
+def last_words(words, max_length):
+    ''' the longest run of words at the end of words that is at most max_length characters long, spaces included '''
+    start = len(words)
+    length = -1 # of ' '.join(words[start:])
+    while start > 0 and length + 1 + len(words[start - 1]) <= max_length:
+        length += 1 + len(words[start - 1])
+        start -= 1
+    return words[start:]
+
+def tweet_signature(words):
+    ''' the set of lowercased words in a tweet - the same for tweets that only differ in order, case or punctuation '''
+    return frozenset(word.lower() for word in words)
 
 # -------------------------------------------------- LEXICAL GLOBALS --------------------------------------------------
+# Each of these is only loaded the first time something uses it, so importing this file is cheap
 # Just use this gensim model made with word2vec for context vector similarity of words!!!
-print 'loading twitter word corpus ...'
-TWITTER_MODEL = gensim.models.Word2Vec.load_word2vec_format('../corpus preparation/prof_corpus.bin', binary=True)
-print '...loaded'
-print 'loading english dictionary...'
-ENGLISH_DICT = enchant.Dict('en_US')
-print '...loaded'
-print 'loading phonology dictionary...'
-PHONE_DICT = cmudict.dict()
-print '...loaded'
\ No newline at end of file
+# (run vectors.py once to convert it to a memory-mapped model that loads almost instantly)
+def build_spelling_index():
+    ''' spelling corrections to the words in PHONE_DICT, the ones in the twitter corpus preferred by how common they are '''
+    return Spelling_Index(dict((word, TWITTER_MODEL.vocab[word].count if word in TWITTER_MODEL.vocab else 0)
+                               for word in PHONE_DICT))
+
+TWITTER_MODEL = Lazy_Resource('twitter word corpus', load_model)
+SPELLING_INDEX = Lazy_Resource('spelling index', lambda: load_spelling_index('../corpus preparation/spelling_index.pkl',
+                               build_spelling_index, (len(PHONE_DICT), len(TWITTER_MODEL.vocab))))
+PHONE_DICT = Lazy_Resource('phonology dictionary', lambda: load_phone_store('../corpus preparation/phone_store.pkl', cmudict.dict))
+RHYME_INDEX = Lazy_Resource('rhyme index', lambda: load_rhyme_index('../corpus preparation/rhyme_index.pkl'))
+SYNONYM_INDEX = Lazy_Resource('synonym index', lambda: load_synonym_index('../corpus preparation/synonym_index.pkl'))
+# words normalize_word had to work hard on
+NORMAL_CACHE = LRU_Cache(50000)
+NORMAL_DISK_CACHE = Disk_Cache('../corpus preparation/normalized.sqlite', 'normalized')
+DEADLINE_SKIPS = 0 # words normalize_words didn't normalize because time was up
+
+def load_resources():
+    ''' loads every lexical resource now rather than on first use - for long-running processes '''
+    for resource in (TWITTER_MODEL, PHONE_DICT, SPELLING_INDEX, RHYME_INDEX, SYNONYM_INDEX):
+        resource.load()
+    # normalized here rather than on first use, so worker processes forked afterwards share one copy of the vectors
+    TWITTER_MODEL.init_sims()
+
+if __name__ == '__main__':
+    # builds the indexes that are too slow to build on first use
+    SPELLING_INDEX.load()
+    print 'building synonym index...'
+    index = build_synonym_index()
+    with open('../corpus preparation/synonym_index.pkl', 'wb') as index_file:
+        cPickle.dump(index, index_file, cPickle.HIGHEST_PROTOCOL)
+    print '...built'
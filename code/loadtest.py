@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for sizing the bot without touching twitter: it records what twitter answers to mentions_timeline and
+    search into a fixture file, then replays those answers through the pipeline main() runs (answer_all, with a pool of
+    workers composing the poems) with mentions arriving at a given rate, one rate after the other, and reports the
+    throughput, the latency of each request (from the mention arriving to its poem being posted) and the rate of failed
+    poems (bad queries, and mentions left without a poem) at each rate
+
+    python loadtest.py -record fixtures.json -mentions 50
+    python loadtest.py -replay fixtures.json -rates 0.5,1,2,4 -workers 4 -duration 60 -output load.json
+    python loadtest.py -synthetic -rates 1,2,4,8   (with bench.py's made up lexicon and tweets instead) '''
+
+import time, json, random, argparse, tempfile, shutil, threading, multiprocessing, Queue
+from pomesic import Request, answer_all, worker_pool, get_api, BUDGET
+from linguistics import load_resources
+from twitter import Twitter_Client, LIMITS, Fake_Status
+from cache import TTL_Cache
+from daemon import drain
+from metrics import METRICS
+import metrics
+
+def status_record(status):
+    ''' the parts of status the bot uses, as a dict that can be turned into JSON '''
+    return {'id': status.id, 'text': status.text, 'screen_name': status.author.screen_name}
+
+class Recording_API(object):
+    ''' wraps a tweepy.API, keeping what mentions_timeline and search answer, and how long they took, in fixtures '''
+    def __init__(self, api):
+        self.api = api
+        self.fixtures = {'mentions': [], 'searches': {}}
+
+    def mentions_timeline(self, *args, **kwargs):
+        mentions = self.api.mentions_timeline(*args, **kwargs)
+        self.fixtures['mentions'].extend(status_record(mention) for mention in mentions if mention != None)
+        return mentions
+
+    def search(self, query, lang=None):
+        started = time.time()
+        results = self.api.search(query, lang=lang)
+        self.fixtures['searches'][query] = {'seconds': time.time() - started,
+                                            'results': [status_record(result) for result in results]}
+        return results
+
+    def save(self, path):
+        with open(path, 'w') as fixtures_file:
+            json.dump(self.fixtures, fixtures_file)
+
+class Replay_API(object):
+    ''' stands in for tweepy.API, answering mentions_timeline and search from fixtures (see Recording_API) and keeping
+        what update_status posts in posted
+        search takes as long as it did when it was recorded, times latency (0 to answer right away), and a query that wasn't
+        recorded gets the results of one that was. update_status takes post_latency seconds '''
+    def __init__(self, fixtures, latency=1.0, post_latency=0.0, sleep=time.sleep):
+        self.mentions = [Fake_Status(record['id'], record['text'], record['screen_name'])
+                         for record in fixtures['mentions']]
+        self.searches = fixtures['searches']
+        self.queries = sorted(self.searches)
+        self.latency = latency
+        self.post_latency = post_latency
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.posted = []
+
+    def mentions_timeline(self, count=20, since_id=None, max_id=None):
+        mentions = [mention for mention in self.mentions if (since_id is None or mention.id > since_id) and
+                    (max_id is None or mention.id <= max_id)]
+        return sorted(mentions, key=lambda mention: -mention.id)[:count]
+
+    def search(self, query, lang=None):
+        recorded = self.searches.get(query)
+        if recorded is None:
+            if not self.queries:
+                return []
+            recorded = self.searches[self.queries[hash(query) % len(self.queries)]]
+        if self.latency:
+            self.sleep(recorded['seconds'] * self.latency)
+        return [Fake_Status(record['id'], record['text'], record['screen_name']) for record in recorded['results']]
+
+    def update_status(self, status):
+        if self.post_latency:
+            self.sleep(self.post_latency)
+        with self.lock:
+            self.posted.append(status)
+
+def record(path, mentions):
+    ''' fetches up to mentions mentions, and the search for each one's query, from twitter and saves them to path '''
+    recording = Recording_API(get_api())
+    api = Twitter_Client(recording)
+    for mention in api.mentions_timeline(count=mentions):
+        if mention != None:
+            Request(mention, api) # searches for the query, if there is one
+    recording.save(path)
+    print 'recorded', len(recording.fixtures['mentions']), 'mentions and', len(recording.fixtures['searches']), 'searches'
+
+def synthetic_fixtures(lexicon, mentions, tweets):
+    ''' fixtures made up with lexicon (a bench.Synthetic_Lexicon): mentions mentions asking for its words, and searches
+        answering each with tweets made up tweets, as if they had taken 0.2 s '''
+    rng = random.Random(0)
+    queries = [rng.choice(lexicon.words) for i in range(max(1, mentions // 2))]
+    return {'mentions': [{'id': i, 'text': '@PomeSic -query "' + rng.choice(queries) + '"', 'screen_name': 'user%d' % i}
+                         for i in range(mentions)],
+            'searches': dict((query, {'seconds': 0.2, 'results': [{'id': j, 'text': ' '.join(lexicon.tweet()),
+                                                                   'screen_name': 'tweeter'} for j in range(tweets)]})
+                             for query in queries)}
+
+def percentile(values, q):
+    ''' the q quantile (e.g. 0.99) of values, None if there are none '''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_rate(replay, api, pool, rate, duration, cache, budget, seed=0):
+    ''' replays mentions arriving at rate per second (at random, like independent users) for duration seconds through
+        answer_all, the way the daemon answers them (everything that arrived while the last batch was answered is answered
+        as the next batch), and returns what happened '''
+    if not replay.mentions:
+        raise ValueError('there are no mentions to replay')
+    rng = random.Random(seed)
+    arrivals = Queue.Queue()
+    done = threading.Event()
+    latencies = []
+    posted_before = len(replay.posted)
+    counters_before = dict(METRICS.counters)
+
+    def arrive():
+        ''' puts a copy of a recorded mention on arrivals at every arrival time, then sets done '''
+        started = time.time()
+        at = 0.0
+        number = 0
+        while True:
+            at += rng.expovariate(rate)
+            if at >= duration:
+                break
+            time.sleep(max(0, started + at - time.time()))
+            mention = replay.mentions[number % len(replay.mentions)]
+            arrival = Fake_Status(number, mention.text, mention.author.screen_name)
+            arrival.arrived = time.time()
+            arrivals.put(arrival)
+            number += 1
+        done.set()
+
+    def answered(mention):
+        latencies.append(time.time() - mention.arrived)
+
+    feeder = threading.Thread(target=arrive)
+    feeder.daemon = True
+    started = time.time()
+    feeder.start()
+    count = 0
+    while not (done.is_set() and arrivals.empty()):
+        batch = drain(arrivals, 0.1)
+        if not batch:
+            continue
+        count += len(batch)
+        answer_all(batch, api, pool, answered, cache, budget)
+    api.flush()
+    seconds = time.time() - started
+    bad_queries = sum('BAD QUERY' in status for status in replay.posted[posted_before:])
+    counters = dict((counter, n - counters_before.get(counter, 0)) for counter, n in METRICS.counters.iteritems())
+    return {'rate': rate, 'mentions': count, 'answered': len(latencies), 'seconds': seconds,
+            'throughput': len(latencies) / seconds, 'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+            'bad_queries': bad_queries, 'no_poem': count - len(latencies),
+            'failed_rate': (bad_queries + count - len(latencies)) / float(max(count, 1)),
+            'template_answers': counters.get('template_answers', 0)}
+
+def print_result(result):
+    print '%6.2f/s: %4d mentions, %6.2f answered/s, p50 %s s, p99 %s s, %5.1f%% failed (%d bad queries, %d without a poem)' % (
+        result['rate'], result['mentions'], result['throughput'],
+        '%.2f' % result['p50'] if result['p50'] is not None else '-', '%.2f' % result['p99'] if result['p99'] is not None else '-',
+        100 * result['failed_rate'], result['bad_queries'], result['no_poem'])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-record', type=str, help='fixture file to record mentions and searches from twitter to')
+    parser.add_argument('-mentions', type=int, default=50, help='mentions to record (or to make up, with -synthetic)')
+    parser.add_argument('-replay', type=str, help='fixture file to replay')
+    parser.add_argument('-synthetic', action='store_true', help="replay made up tweets with bench.py's made up lexicon")
+    parser.add_argument('-rates', type=str, default='0.5,1,2,4', help='mentions per second to try, one after the other')
+    parser.add_argument('-duration', type=float, default=60, help='seconds mentions keep arriving at each rate')
+    parser.add_argument('-workers', type=int, default=multiprocessing.cpu_count(), help='processes composing poems')
+    parser.add_argument('-budget', type=float, default=BUDGET, help='seconds composing a poem may take')
+    parser.add_argument('-cache_ttl', type=float, default=0, help='seconds to remember the tweets and poems for a query (0 to '
+                        'compose every poem, as replayed queries repeat far more than real ones)')
+    parser.add_argument('-latency', type=float, default=1.0, help='times the recorded search time each search takes')
+    parser.add_argument('-post_latency', type=float, default=0.0, help='seconds posting a reply takes')
+    parser.add_argument('-rate_limits', action='store_true', help="keep twitter's rate limits, which cap the throughput")
+    parser.add_argument('-output', type=str, help='file to write the results to as JSON')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.mentions)
+        return
+
+    metrics.VERBOSE = False
+    directory = None
+    if args.synthetic:
+        from bench import Synthetic_Lexicon
+        directory = tempfile.mkdtemp()
+        print 'making up a lexicon...'
+        lexicon = Synthetic_Lexicon()
+        lexicon.install(directory)
+        print '...made'
+        fixtures = synthetic_fixtures(lexicon, args.mentions, 25)
+    elif args.replay:
+        with open(args.replay) as fixtures_file:
+            fixtures = json.load(fixtures_file)
+        load_resources()
+    else:
+        parser.error('one of -record, -replay or -synthetic is needed')
+
+    replay = Replay_API(fixtures, args.latency, args.post_latency)
+    api = Twitter_Client(replay, LIMITS if args.rate_limits else {})
+    # forked after loading, so the workers share the resources
+    pool = worker_pool(args.workers)
+    results = []
+    try:
+        for rate in [float(rate) for rate in args.rates.split(',')]:
+            cache = TTL_Cache(200, args.cache_ttl) if args.cache_ttl > 0 else None
+            results.append(run_rate(replay, api, pool, rate, args.duration, cache, args.budget))
+            print_result(results[-1])
+    finally:
+        pool.terminate()
+        if directory is not None:
+            shutil.rmtree(directory)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'workers': args.workers, 'duration': args.duration, 'budget': args.budget, 'results': results},
+                      output_file, indent=1)
+
+if __name__ == '__main__':
+    main()
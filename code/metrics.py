@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for measuring where the time goes: how long each stage of answering a mention takes (spans), how often
+    things happen (counters), and for sending those measurements somewhere (sinks) '''
+
+import time, json, threading, contextlib
+
+VERBOSE = True # set to False to silence the debug output of the poem pipeline
+
+# upper bounds, in seconds, of the buckets of every histogram - anything slower goes in a last, unbounded bucket
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300]
+
+def log(*parts):
+    ''' prints parts separated by spaces, like print, unless VERBOSE is False '''
+    if VERBOSE:
+        print ' '.join(str(part) for part in parts)
+
+class Histogram(object):
+    ''' how many durations fell in each of BUCKETS, and their count, sum and maximum '''
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        bucket = 0
+        while bucket < len(BUCKETS) and seconds > BUCKETS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        ''' upper bound of the bucket holding the q quantile (e.g. 0.99), None if it's in the unbounded bucket '''
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return BUCKETS[bucket] if bucket < len(BUCKETS) else None
+        return None
+
+    def report(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.max, 'buckets': BUCKETS, 'counts': self.counts,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99)}
+
+class Metrics(object):
+    ''' counters and a latency histogram per stage
+        picklable, so measurements taken in a worker process can be sent back and merged into the main process' METRICS, and
+        safe to update from several threads (e.g. the reply sender's) '''
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock'] # locks can't be pickled
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        ''' times the body of a with statement as one run of stage '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - start)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if not stage in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def merge(self, other):
+        with self.lock:
+            for counter, n in other.counters.iteritems():
+                self.counters[counter] = self.counters.get(counter, 0) + n
+            for stage, histogram in other.histograms.iteritems():
+                if not stage in self.histograms:
+                    self.histograms[stage] = Histogram()
+                self.histograms[stage].merge(histogram)
+
+    def report(self):
+        ''' everything measured so far, as a dict that can be turned into JSON '''
+        with self.lock:
+            return {'time': time.time(), 'counters': dict(self.counters),
+                    'stages': dict((stage, histogram.report()) for stage, histogram in self.histograms.iteritems())}
+
+def print_sink(report):
+    ''' prints a summary of report '''
+    for counter in sorted(report['counters']):
+        print '%-28s %d' % (counter, report['counters'][counter])
+    for stage in sorted(report['stages']):
+        histogram = report['stages'][stage]
+        print '%-28s %6d runs, %9.3f s total, p50 <= %s s, p99 <= %s s, max %.3f s' % (stage, histogram['count'],
+            histogram['sum'], histogram['p50'], histogram['p99'], histogram['max'])
+
+class JSON_Lines_Sink(object):
+    ''' appends every report to the file at path, one JSON object per line '''
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, report):
+        with open(self.path, 'a') as sink_file:
+            sink_file.write(json.dumps(report) + '\n')
+
+METRICS = Metrics()
+SINKS = [] # functions export passes the report to
+
+def export():
+    ''' sends everything in METRICS to every sink in SINKS '''
+    report = METRICS.report()
+    for sink in SINKS:
+        sink(report)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for storing the cmudict pronunciations compactly, with the syllable count and rhyme key of every word worked
+    out once when the store is built, so that looking them up later is just indexing into an array '''
+
+import cPickle
+from array import array
+
+NO_RHYME = -1 # rhyme id of words without a vowel
+
+class Phone_Store(object):
+    ''' the first pronunciation of every word in a cmudict style dictionary ({word: [[phoneme, ...], ...]})
+        phonemes are interned as small integer codes, and the codes of all words are kept in one flat array, with the
+        pronunciation of the word in row r going from offsets[r] to offsets[r + 1]
+        rhyme keys (see linguistics.rhyme_key) are interned the same way '''
+    def __init__(self, pronunciations=None):
+        self.symbols = []          # phoneme code to phoneme
+        self.rhyme_keys = []       # rhyme id to rhyme key
+        self.rows = {}             # word to row
+        self.codes = array('B')    # phoneme codes of every word, one after the other
+        self.offsets = array('I', [0])
+        self.syllables = array('B')
+        self.rhymes = array('i')   # rhyme id of every word, NO_RHYME if it has no vowel
+        if pronunciations is not None:
+            self.add_all(pronunciations)
+
+    def add_all(self, pronunciations):
+        symbol_codes = {}
+        rhyme_ids = {}
+        for word, prons in pronunciations.iteritems():
+            phonemes = prons[0]
+            self.rows[word] = len(self.syllables)
+            for phoneme in phonemes:
+                if not phoneme in symbol_codes:
+                    symbol_codes[phoneme] = len(self.symbols)
+                    self.symbols.append(phoneme)
+                self.codes.append(symbol_codes[phoneme])
+            self.offsets.append(len(self.codes))
+            vowels = [i for i, phoneme in enumerate(phonemes) if phoneme[-1].isdigit()]
+            self.syllables.append(min(len(vowels), 255))
+            if vowels:
+                key = ' '.join(phonemes[vowels[-1]:])
+                if not key in rhyme_ids:
+                    rhyme_ids[key] = len(self.rhyme_keys)
+                    self.rhyme_keys.append(key)
+                self.rhymes.append(rhyme_ids[key])
+            else:
+                self.rhymes.append(NO_RHYME)
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, word):
+        ''' the pronunciations of word, the way cmudict.dict() has them (only the first one is stored) '''
+        return [self.phonemes(word)]
+
+    def phonemes(self, word):
+        ''' the phonemes of word as a list of strings, raises KeyError if it isn't in the store '''
+        row = self.rows[word]
+        return [self.symbols[code] for code in self.codes[self.offsets[row]:self.offsets[row + 1]]]
+
+    def syllable_count(self, word):
+        return self.syllables[self.rows[word]]
+
+    def rhyme_id(self, word):
+        ''' integer standing for the rhyme key of word - two words in the store rhyme exactly when their rhyme ids are equal
+            and not NO_RHYME '''
+        return self.rhymes[self.rows[word]]
+
+    def rhyme_key(self, word):
+        ''' the rhyme key of word, raises IndexError if it has no vowel, like linguistics.rhyme_key '''
+        rhyme = self.rhyme_id(word)
+        if rhyme == NO_RHYME:
+            raise IndexError('no vowel in ' + word)
+        return self.rhyme_keys[rhyme]
+
+    def save(self, path):
+        with open(path, 'wb') as store_file:
+            cPickle.dump((self.symbols, self.rhyme_keys, self.rows, self.codes.tostring(), self.offsets.tostring(),
+                          self.syllables.tostring(), self.rhymes.tostring()), store_file, cPickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        store = Phone_Store()
+        with open(path, 'rb') as store_file:
+            store.symbols, store.rhyme_keys, store.rows, codes, offsets, syllables, rhymes = cPickle.load(store_file)
+        store.codes = array('B', codes)
+        store.offsets = array('I', offsets)
+        store.syllables = array('B', syllables)
+        store.rhymes = array('i', rhymes)
+        return store
+
+def load_phone_store(path, pronunciations):
+    ''' loads the store saved at path, or builds it from the dictionary returned by pronunciations() and saves it there '''
+    try:
+        return Phone_Store.load(path)
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        store = Phone_Store(pronunciations())
+        store.save(path)
+        return store
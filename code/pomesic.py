@@ -3,88 +3,170 @@
 
 #tutorial from http://www.dototot.com/how-to-write-a-twitter-bot-with-python-and-tweepy/
 
-import tweepy, time, sys, Queue, pprint, argparse, copy
-from linguistics import hard_string_similarity, make_rhyme, make_same_syl_count, normalize_word, remove_punctuation
+import time, sys, pprint, argparse, copy, heapq, signal, collections, multiprocessing
+from linguistics import tweet_similarity_matrix, Rhyme_Feasibility, make_rhyme_scored, equalize_syllables, equalize_lines, best_rhyme, nsyl_sent, normalize_words, clean_tweet, last_words, tweet_signature, load_resources, normalization_stats
+from daemon import run_daemon, fetch_mentions
+from metrics import log, Metrics, METRICS, SINKS, print_sink, JSON_Lines_Sink, export
+from cache import TTL_Cache
+from twitter import Twitter_Client
+from seen import open_seen
+from jobs import open_queue, enqueue, run_consumer
+import metrics
 # from pprint import pprint
 
+BUDGET = 30    # seconds composing a poem may take before settling for the best one found so far
+CANDIDATES = 3 # poems (from different pairs of tweets) to compose and choose the best of, while the budget lasts
+COUPLET = 'AA' # the default scheme: two lines that rhyme
+MAX_LINES = 6
+TWEET_LENGTH = 140 # the most characters twitter will post
+BEAM_WIDTH = 8 # partial poems kept at each line by beam_search
+# the answer when no pair of tweets could be made into a poem
+TEMPLATE = '''i looked for {query} high and low\nbut found no rhyme to make it flow'''
+
 class Request:
-    ''' class to store the parameters for the poem, and actually construct the poem '''
-    def __init__(self, status_object, api):
+    ''' class to store the parameters for the poem, and actually construct the poem
+        if cache (a TTL_Cache of query to Query_Results) is given, the search results are taken from it when the query was
+        asked recently, and put in it otherwise
+        composing stops after budget seconds or candidates poems, whichever comes first '''
+    def __init__(self, status_object, api, cache=None, budget=BUDGET, candidates=CANDIDATES):
         self.BAD_QUERY = False
         self.sender = status_object.author.screen_name
+        self.budget = budget
+        self.candidates = candidates
+        # how long each stage took, and counts of what happened, for the main process to merge into METRICS
+        self.metrics = Metrics()
+        # ids of the pairs of tweets that earlier poems for the query were made from, and of the one this poem is made from
+        self.used_pairs = frozenset()
+        self.pair = None
+        self.score = None # similarity of the pair
+        self.cost = None  # how much the pair's tweets had to be changed, see compose_poem
+        self.alternatives = [] # the other poems composed, as (poem, pair), best first
+        self.budget_used = {} # stage of composing to the fraction of the budget it took
         try:
             parser = argparse.ArgumentParser()
             parser.add_argument('-query', type=str, help='what do you want to search', required=True)
+            parser.add_argument('-lines', type=int, help='how many lines the poem should have')
+            parser.add_argument('-scheme', type=str, help='which lines rhyme, e.g. ABAB (default: couplets, AABB...)')
             args = parser.parse_args(split_ignore_quotes(status_object.text)[1:])
 
             self.query = args.query
-
-            # Download the tweets
-            print 'searching english tweets...'
-            self.searches = {}
-            for result in api.search(self.query, lang='en'):
-                self.searches[str(result.id)] = remove_punctuation(result.text).split()
-
-            print '...searched'
-            print 'trimming tweets that are too long...'
-            self.cut()
-            print '...trimmed'
+            self.lines = args.lines or (len(args.scheme) if args.scheme else len(COUPLET))
+            self.scheme = args.scheme.upper() if args.scheme else ''.join(chr(ord('A') + i // 2) for i in range(self.lines))
+            if len(self.scheme) != self.lines or not 2 <= self.lines <= MAX_LINES or not self.scheme.isalpha():
+                raise ValueError('bad scheme')
+
+            cached = cache.get(self.query) if cache is not None else None
+            if cached is not None:
+                self.searches = cached.searches
+                self.used_pairs = frozenset(cached.used_pairs)
+                self.metrics.count('search_cache_hits')
+            else:
+                # Download the tweets, cleaning each one as it comes and leaving out retweets and (near) duplicates
+                log('searching english tweets...')
+                self.searches = {}
+                signatures = set()
+                with self.metrics.span('search'):
+                    for result in api.search(self.query, lang='en'):
+                        words = clean_tweet(result.text)
+                        signature = tweet_signature(words)
+                        if not words or signature in signatures:
+                            self.metrics.count('duplicates_dropped')
+                            continue
+                        signatures.add(signature)
+                        self.searches[str(result.id)] = words
+
+                log('...searched')
+                if cache is not None:
+                    cache.put(self.query, Query_Results(self.searches))
 
         except:
             self.BAD_QUERY = True
 
-    def cut(self):
-        ''' Removes all @xxxx from tweets, and then trims tweets until they are under 70 characters
-            keeps hashtags '''
-        for tweet in self.searches:
-            no_ats = []
-            for word in self.searches[tweet]:
-                if not 'http' in word:
-                    no_ats += [word]
-            self.searches[tweet] = no_ats
-            while len(' '.join(self.searches[tweet])) > 65:
-                self.searches[tweet] = self.searches[tweet][1:]
-
     def get_poem(self):
+        with self.metrics.span('get_poem'):
+            poem = self.compose_poem()
+        self.metrics.count('poems' if self.pair is not None else 'no_poem')
+        self.budget_used = dict((stage, histogram.total / max(self.budget, 1e-6))
+                                for stage, histogram in self.metrics.histograms.iteritems() if not stage in ('search', 'get_poem'))
+        log('budget used:', ', '.join('%s %.0f%%' % (stage, 100 * used) for stage, used in sorted(self.budget_used.items())))
+        return poem
+
+    def compose_poem(self):
+        ''' the best poem (lowest cost) of the first candidates pairs of tweets that can be made into one (or sets of tweets,
+            for schemes other than a couplet), or of those tried before the budget ran out, or the template if there are none.
+            the cost is 1 - the similarity of the new rhyming word(s) plus the cost of equalizing the syllables
+            the other poems are kept in self.alternatives, for answering other senders asking for the same query '''
         if self.BAD_QUERY:
-            return '@' + self.sender + '''BAD QUERY - request must be in the format: \n (AT)PomeSic -query "query", where "query" must be in quotes'''
-
-        pairs = []
-        for one in self.searches:
-            for two in self.searches:
-                if one != two:
-                    if self.searches[one] != self.searches[two]:
-                        pairs.append((self.searches[one], self.searches[two]))
-        scores = [None] * len(pairs)
-        for i in range(len(pairs)):
-            scores[i] = (pairs[i], hard_string_similarity(pairs[i][0], pairs[i][1]))
-        scores.sort(key = lambda x: x[1], reverse = True)
-
-        inverse_searches = dict((' '.join(v),k) for k, v in self.searches.iteritems())
+            return '@' + self.sender + '''BAD QUERY - request must be in the format: \n (AT)PomeSic -query "query" [-lines 4] [-scheme ABAB], where "query" must be in quotes'''
+
+        deadline = time.time() + self.budget
+        found = [] # (cost, poem, pair, score)
+        ids = self.searches.keys()
+        tweets = [self.searches[tweet_id] for tweet_id in ids]
+        with self.metrics.span('scoring'):
+            similarity = tweet_similarity_matrix(tweets)
         # print self.searches
-        # print scores
-
-        for i in range(len(scores)):
-            tweet1 = scores[i][0][0]
-            tweet2 = scores[i][0][1]
-
-            tweet1_id = inverse_searches[' '.join(tweet1)]
-            tweet2_id = inverse_searches[' '.join(tweet2)]
-
-            print 'trying to compose a poem from:'
-            print '\ttweet1: ' + ' '.join(tweet1)
-            print '\ttweet2: ' + ' '.join(tweet2)
+        # every word of every tweet, normalized once rather than for every pair it is in
+        cache_stats = normalization_stats()
+        with self.metrics.span('normalization'):
+            normalized_words = normalize_words((word for tweet in tweets for word in tweet), deadline)
+        for counter, n in normalization_stats().iteritems():
+            self.metrics.count('normalization_' + counter, n - cache_stats[counter])
+        # the word each tweet will end on, to skip the pairs make_rhyme can't work for before trying them
+        with self.metrics.span('feasibility'):
+            rhyming = Rhyme_Feasibility([(' '.join(normalized_words[word] for word in tweet).split() or [''])[-1]
+                                         for tweet in tweets])
+
+        if self.scheme == COUPLET:
+            poems = self.couplets(ids, tweets, similarity, normalized_words, rhyming, deadline)
+        else:
+            poems = self.stanzas(ids, tweets, similarity, normalized_words, rhyming, deadline)
+        for poem in poems:
+            found.append(poem)
+            if len(found) >= self.candidates:
+                break
+
+        if not found:
+            self.metrics.count('template_answers')
+            return '@' + self.sender + '\n' + TEMPLATE.format(query=self.query)
+        found.sort(key=lambda poem: poem[0])
+        self.cost, poem, self.pair, self.score = found[0]
+        self.alternatives = [(other, pair) for cost, other, pair, score in found[1:]]
+        return poem
+
+    def couplets(self, ids, tweets, similarity, normalized_words, rhyming, deadline):
+        ''' yields (cost, poem, pair, score) for every pair of tweets that can be made into a rhyming couplet, most similar
+            first, until the deadline '''
+        for one, two in ranked_pairs(similarity, tweets):
+            if time.time() > deadline:
+                self.metrics.count('deadline_exceeded')
+                break
+            if (ids[one], ids[two]) in self.used_pairs:
+                continue
+            with self.metrics.span('feasibility'):
+                feasible = rhyming.feasible(one, two)
+            if not feasible:
+                self.metrics.count('pairs_infeasible')
+                continue
+            self.metrics.count('pairs_tried')
+            # copies, so that a failed attempt doesn't change the tweets for the next pair
+            tweet1 = list(tweets[one])
+            tweet2 = list(tweets[two])
+
+            log('trying to compose a poem from:')
+            log('\ttweet1: ' + ' '.join(tweet1))
+            log('\ttweet2: ' + ' '.join(tweet2))
 
             normalization_dict = {}
 
             for i in range(len(tweet1)):
-                normalized = normalize_word(tweet1[i])
+                normalized = normalized_words[tweet1[i]]
                 tweet1[i] = normalized
                 if i != len(tweet1) - 1:
                     normalization_dict[tweet1[i]] = normalized
 
             for i in range(len(tweet2)):
-                normalized = normalize_word(tweet2[i])
+                normalized = normalized_words[tweet2[i]]
                 tweet2[i] = normalized
                 if i != len(tweet1) - 1:
                     normalization_dict[tweet2[i]] = normalized
@@ -95,27 +177,29 @@ class Request:
             tweet1 = ' '.join(tweet1).split()
             tweet2 = ' '.join(tweet2).split()
 
-            print 'post normalization:'
-            print '\ttweet1: ' + ' '.join(tweet1)
-            print '\ttweet2: ' + ' '.join(tweet2)
+            log('post normalization:')
+            log('\ttweet1: ' + ' '.join(tweet1))
+            log('\ttweet2: ' + ' '.join(tweet2))
 
             try:
             # if True:
-                print 'before rhyming changes:'
-                print '\ttweet1: ' + ' '.join(tweet1)
-                print '\ttweet2: ' + ' '.join(tweet2)
+                log('before rhyming changes:')
+                log('\ttweet1: ' + ' '.join(tweet1))
+                log('\ttweet2: ' + ' '.join(tweet2))
 
-                tweet1, tweet2 = make_rhyme(tweet1, tweet2)
+                with self.metrics.span('make_rhyme'):
+                    tweet1, tweet2, rhyme_score = make_rhyme_scored(tweet1, tweet2)
 
-                print 'after rhyming changes, before syllable changes:'
-                print '\ttweet1: ' + ' '.join(tweet1)
-                print '\ttweet2: ' + ' '.join(tweet2)
+                log('after rhyming changes, before syllable changes:')
+                log('\ttweet1: ' + ' '.join(tweet1))
+                log('\ttweet2: ' + ' '.join(tweet2))
 
-                tweet1, tweet2 = make_same_syl_count(tweet1, tweet2)
+                with self.metrics.span('make_same_syl_count'):
+                    tweet1, tweet2, syllable_cost = equalize_syllables(tweet1, tweet2)
 
-                print 'after syllable:'
-                print '\ttweet1: ' + ' '.join(tweet1)
-                print '\ttweet2: ' + ' '.join(tweet2)
+                log('after syllable:')
+                log('\ttweet1: ' + ' '.join(tweet1))
+                log('\ttweet2: ' + ' '.join(tweet2))
 
                 for i in range(len(tweet1)):
                     if tweet1[i] in reverse_normalization:
@@ -124,19 +208,171 @@ class Request:
                     if tweet2[i] in reverse_normalization:
                         tweet2[i] = reverse_normalization[tweet2[i]]
 
-                print 'after de-normalization:'
-                print '\ttweet1: ' + ' '.join(tweet1)
-                print '\ttweet2: ' + ' '.join(tweet2)
+                log('after de-normalization:')
+                log('\ttweet1: ' + ' '.join(tweet1))
+                log('\ttweet2: ' + ' '.join(tweet2))
 
-                return '@' + self.sender + '\n' + ' '.join(tweet1) + '\n' + ' '.join(tweet2)
+                poem = '@' + self.sender + '\n' + ' '.join(tweet1) + '\n' + ' '.join(tweet2)
+                yield (1 - rhyme_score) + syllable_cost, poem, (ids[one], ids[two]), float(similarity[one, two])
 
             except Exception, e:
-                print 'exception:', str(e)
-                print 'moving to next pair of tweets'
+                self.metrics.count('pairs_failed')
+                log('exception:', str(e))
+                log('moving to next pair of tweets')
+
+    def stanzas(self, ids, tweets, similarity, normalized_words, rhyming, deadline):
+        ''' yields (cost, poem, ids of its tweets, score) for the tweets beam_search picks for self.scheme, best first, that
+            can be made to rhyme as the scheme says and to have the same number of syllables, until the deadline
+            a line rhyming with an earlier one keeps its last word if it already rhymes and doesn't end another line of its
+            rhyme group, otherwise that word is replaced with the rhyme of the earlier line's last word closest to it
+            (best_rhyme) among those not ending a line of the group yet, which costs 1 - their similarity
+            every line is cut down to its share of TWEET_LENGTH (keeping its last words, like clean_tweet), so the poem can
+            be posted - here rather than when searching, as the search results are shared by requests for any number of lines '''
+        width = (TWEET_LENGTH - len('@' + self.sender) - self.lines) // self.lines
+        lines = [(last_words(' '.join(normalized_words[word] for word in tweet).split(), width) or ['']) for tweet in tweets]
+        syllables = [nsyl_sent(line) for line in lines]
+        with self.metrics.span('beam_search'):
+            chosen = beam_search(similarity, rhyming, syllables, self.scheme)
+        for score, rows in chosen:
+            if time.time() > deadline:
+                self.metrics.count('deadline_exceeded')
+                return
+            if tuple(ids[row] for row in rows) in self.used_pairs:
+                continue
+            self.metrics.count('stanzas_tried')
+            stanza = [list(lines[row]) for row in rows]
+            log('trying to compose a poem from:')
+            for line in stanza:
+                log('\t' + ' '.join(line))
+            try:
+                rhyme_cost = 0
+                endings = {} # rhyme letter to the words ending its lines so far
+                with self.metrics.span('make_rhyme'):
+                    for i, letter in enumerate(self.scheme):
+                        first = self.scheme.index(letter)
+                        group = endings.setdefault(letter, set())
+                        if first != i and (rhyming.keys[rows[i]] is None or rhyming.keys[rows[i]] != rhyming.keys[rows[first]]
+                                           or stanza[i][-1] in group):
+                            rhyme, rhyme_score = best_rhyme(stanza[first][-1], stanza[i][-1], group)
+                            stanza[i][-1] = rhyme
+                            rhyme_cost += 1 - rhyme_score
+                        group.add(stanza[i][-1])
+                with self.metrics.span('make_same_syl_count'):
+                    stanza, syllable_cost = equalize_lines(stanza)
+            except Exception, e:
+                self.metrics.count('stanzas_failed')
+                log('exception:', str(e))
+                log('moving to next set of tweets')
+                continue
+            poem = '@' + self.sender + '\n' + '\n'.join(' '.join(line) for line in stanza)
+            if len(poem) > TWEET_LENGTH: # the new rhymes or synonyms made it longer
+                self.metrics.count('stanzas_too_long')
+                continue
+            yield rhyme_cost + syllable_cost, poem, tuple(ids[row] for row in rows), score
 
     # String representation of the instance variables relevant to the query
     def __repr__(self):
-        return '@' + self.sender + ' query: ' + self.query + '\nlines: ' + self.lines + '\nscheme: ' + self.scheme + '\nflex: ' + str(self.flex)
+        return '@' + self.sender + ' query: ' + self.query + '\nlines: ' + str(self.lines) + '\nscheme: ' + self.scheme
+
+class Query_Results:
+    ''' what is remembered about a recent query: its cleaned search results, the poems made from them (without the @sender
+        line), the rhyme scheme of each, who each poem has been sent to, and the pairs (or sets) of tweets (by id) already
+        made into poems '''
+    def __init__(self, searches):
+        self.searches = searches
+        self.poems = []
+        self.schemes = []
+        self.receivers = [] # set of senders for each poem
+        self.used_pairs = set()
+
+    def poem_for(self, sender, scheme=COUPLET):
+        ''' the poem with the rhyme scheme scheme sent to the fewest people among those sender hasn't had yet, or None if
+            sender has had them all, so different senders get different poems while there are enough '''
+        options = [i for i in range(len(self.poems)) if self.schemes[i] == scheme and not sender in self.receivers[i]]
+        if not options:
+            return None
+        best = min(options, key=lambda i: len(self.receivers[i]))
+        self.receivers[best].add(sender)
+        return self.poems[best]
+
+    def add_poem(self, poem, pair, sender=None, scheme=COUPLET):
+        ''' remembers poem, made from pair, as sent to sender - or to nobody yet, with no sender '''
+        self.poems.append(poem)
+        self.schemes.append(scheme)
+        self.receivers.append(set([sender]) if sender is not None else set())
+        self.used_pairs.add(pair)
+
+class Finished:
+    ''' stands in for the pool's AsyncResult when there is nothing to compose '''
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.value
+
+def ranked_pairs(similarity, tweets, batch_size=16):
+    ''' yields (one, two) indices of pairs of different tweets, most similar first, only as the caller asks for them
+        the similarity is symmetric, so each unordered pair is considered once. only batch_size pairs are kept in a heap, and
+        the next batch (the best pairs ranked below the last one yielded) is only searched for once the previous one is used up '''
+    bound = None
+    while True:
+        heap = []
+        for one in xrange(len(tweets)):
+            row = similarity[one].tolist()
+            for two in xrange(one + 1, len(tweets)):
+                if tweets[one] == tweets[two]:
+                    continue
+                candidate = (row[two], -one, -two)
+                if bound is not None and candidate >= bound:
+                    continue
+                if len(heap) < batch_size:
+                    heapq.heappush(heap, candidate)
+                elif candidate > heap[0]:
+                    heapq.heapreplace(heap, candidate)
+        if not heap:
+            return
+        for score, one, two in sorted(heap, reverse=True):
+            yield -one, -two
+        bound = heap[0]
+
+def beam_search(similarity, rhyming, syllables, scheme, width=BEAM_WIDTH, expand=16):
+    ''' picks tweets (by row of similarity) for the lines of a poem with the rhyme scheme "scheme", e.g. ABAB, without trying
+        every combination: only the width best partial poems are kept after each line, and each is only extended with the
+        expand tweets most similar to its last line that could rhyme as the scheme says
+        a partial poem's score adds up the similarity of every line to the one before it, minus 1 for every line whose last
+        word will have to be replaced to rhyme (when it doesn't already rhyme, per rhyming.keys, but the earlier line's word
+        has rhymes) and 0.1 per syllable it differs from the first line by
+        returns the complete poems as (score, rows) tuples, best first '''
+    n = len(syllables)
+    # the first lines are the tweets closest to all the others
+    centrality = similarity.sum(axis=1).tolist()
+    beam = [(0.0, (row,)) for row in sorted(range(n), key=lambda row: -centrality[row])[:width]]
+    for position in range(1, len(scheme)):
+        first = scheme.index(scheme[position])
+        extended = []
+        for score, rows in beam:
+            row_similarity = similarity[rows[-1]].tolist()
+            options = 0
+            for row in sorted(range(n), key=lambda row: -row_similarity[row]):
+                if options >= expand:
+                    break
+                if row in rows:
+                    continue
+                cost = 0.1 * abs(syllables[row] - syllables[rows[0]])
+                if first < position:
+                    anchor = rows[first]
+                    key = rhyming.keys[row]
+                    if key is None or key != rhyming.keys[anchor] or rhyming.last_words[row] == rhyming.last_words[anchor]:
+                        if not rhyming.rhymable[anchor]:
+                            continue
+                        cost += 1
+                options += 1
+                extended.append((score + row_similarity[row] - cost, rows + (row,)))
+        beam = heapq.nlargest(width, extended)
+    return beam
 
 def split_ignore_quotes(text):
     ''' splits on spaces except treats things in quotes as one item - used to allow for multiple word queries in quotes
@@ -146,57 +382,195 @@ def split_ignore_quotes(text):
     result = result[0].split() + [result[1]] + result[2].split()
     return result
     
-def main():
+def get_api():
+    import tweepy
     CONSUMER_KEY = 'REDACTED'
     CONSUMER_SECRET = 'REDACTED'
     ACCESS_TOKEN = 'REDACTED'
     ACCESS_SECRET = 'REDACTED'
     auth = tweepy.OAuthHandler(CONSUMER_KEY, CONSUMER_SECRET)
     auth.set_access_token(ACCESS_TOKEN, ACCESS_SECRET)
-    api = tweepy.API(auth) 
-    # Open the file containing the tweets already processed
-    try:
-        seen_file = open('SEEN', 'r')
-    except:
-        open('SEEN','w').close()
-        seen_file = open('SEEN', 'r')
-    # Store it in processed_tweets
-    processed_tweets = [line.strip() for line in seen_file]
-    seen_file.close()
-
-    q = Queue.Queue() # tweets that need to be processed
-    done = set()      # tweets that have been processed, must be added to seen_file
+    return tweepy.API(auth)
+
+def worker_pool(workers):
+    ''' a pool of that many processes to compose poems in, which ignore SIGINT: ctrl-c goes to the whole process group, and a
+        worker it killed in the middle of a poem would leave the main process waiting for that poem forever - shutting down
+        is left to the main process '''
+    return multiprocessing.Pool(workers, initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+
+def compose(request):
+    ''' composes the poem for request and returns it with the pair of tweets used, request's metrics and the other poems
+        composed (see Request.alternatives) - runs in the worker processes, which share the lexical resources that were loaded
+        before they were forked rather than each loading its own copy '''
+    return request.get_poem(), request.pair, request.metrics, request.alternatives
+
+def answer_all(mentions, api, pool, answered, cache=None, budget=BUDGET, claim=None):
+    ''' searches for each mention's query here while the poems for earlier mentions are composed in pool, and queues the poems
+        on api (a Twitter_Client) to be tweeted back in the order of mentions, with answered(mention) called as each one is
+        tweeted - api.flush() waits for that
+        with a cache (see Request), a query asked recently is answered with one of its poems the sender hasn't had yet (one
+        nobody has had, like the runners-up composed along with the first poem, if there is one), or failing that with a
+        new poem from a pair of tweets not used before. a mention for a query that already has a poem
+        being composed waits for that poem, which may do for it too. budget is the seconds each poem may take (see Request)
+        claim(mention), if given, is called just before a poem is queued and the poem is dropped if it returns False - for
+        mentions leased from a job queue, which another consumer may have answered meanwhile '''
+    # (mention, request, Query_Results, poem being composed or None while waiting, when we started on it), oldest first
+    pending = collections.deque()
+
+    def start_composing(request, results):
+        if results is not None:
+            poem = results.poem_for(request.sender, request.scheme)
+            if poem is not None:
+                METRICS.count('poem_cache_hits')
+                return Finished(('@' + request.sender + '\n' + poem, None, request.metrics, []))
+            request.used_pairs = frozenset(results.used_pairs)
+        return pool.apply_async(compose, (request,))
+
+    def tweet_back(mention, request, results, composing, started):
+        if composing is None:
+            composing = start_composing(request, results)
+        try:
+            poem, pair, request_metrics, alternatives = composing.get()
+        except Exception, e:
+            print 'failed to compose a poem for ' + str(mention.id) + ':', str(e)
+            METRICS.count('requests_failed')
+            return
+        METRICS.merge(request_metrics)
+        if poem is None:
+            print 'no poem for ' + str(mention.id)
+            METRICS.count('requests_failed')
+            return
+        if claim is not None and not claim(mention):
+            print 'lost the lease on ' + str(mention.id) + ', not answering it'
+            METRICS.count('leases_lost')
+            return
+        if results is not None and pair is not None:
+            results.add_poem(poem.split('\n', 1)[1], pair, request.sender, request.scheme)
+            for alternative, alternative_pair in alternatives:
+                results.add_poem(alternative.split('\n', 1)[1], alternative_pair, scheme=request.scheme)
+        log('...poem composed:')
+        log(poem)
+        def sent():
+            METRICS.observe('request', time.time() - started)
+            METRICS.count('requests')
+            answered(mention)
+        api.reply(poem, sent) # will need to be changed to get_poem or whatever
+
+    for mention in mentions:
+        log('composing poem...')
+        started = time.time()
+        request = Request(mention, api, cache, budget)
+        results = cache.get(request.query) if cache is not None and not request.BAD_QUERY else None
+        if results is not None and any(earlier[2] is results for earlier in pending):
+            composing = None # decided when its turn comes
+        else:
+            composing = start_composing(request, results)
+        pending.append((mention, request, results, composing, started))
+        while pending and (pending[0][3] is None or pending[0][3].ready()):
+            tweet_back(*pending.popleft())
+    while pending:
+        tweet_back(*pending.popleft())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-daemon', action='store_true', help='keep running and answer mentions as they arrive')
+    parser.add_argument('-min_interval', type=float, default=15, help='seconds between polls while mentions keep coming')
+    parser.add_argument('-max_interval', type=float, default=240, help='longest wait between polls while it is quiet')
+    parser.add_argument('-workers', type=int, default=multiprocessing.cpu_count(), help='processes composing poems')
+    parser.add_argument('-quiet', action='store_true', help='leave out the debug output of composing poems')
+    parser.add_argument('-cache_ttl', type=float, default=900, help='seconds to remember the tweets and poems for a query (0 to not)')
+    parser.add_argument('-cache_size', type=int, default=200, help='most queries to remember')
+    parser.add_argument('-metrics', type=str, help='file to append timings and counters to as JSON lines (default: print them)')
+    parser.add_argument('-budget', type=float, default=BUDGET, help='seconds composing a poem may take')
+    parser.add_argument('-seen', type=str, default='SEEN.sqlite', help='file recording the mentions already answered')
+    parser.add_argument('-seen_days', type=float, default=7, help='days to keep answered mentions in it before compacting them')
+    parser.add_argument('-retries', type=int, default=3, help='times to retry a failed call to twitter')
+    parser.add_argument('-produce', action='store_true', help='only put the mentions on the job queue, for consumers to answer')
+    parser.add_argument('-consume', action='store_true', help='only answer the mentions on the job queue, until stopped')
+    parser.add_argument('-queue', type=str, default='JOBS.sqlite', help='job queue file, or redis://host:port/db')
+    parser.add_argument('-lease', type=float, default=300, help='seconds a consumer has to answer a mention before it is retried')
+    args = parser.parse_args()
+
+    metrics.VERBOSE = not args.quiet
+    SINKS.append(JSON_Lines_Sink(args.metrics) if args.metrics else print_sink)
+    cache = TTL_Cache(args.cache_size, args.cache_ttl) if args.cache_ttl > 0 else None
+
+    api = Twitter_Client(get_api(), retries=args.retries)
+    if args.consume:
+        queue = open_queue(args.queue)
+        load_resources()
+        pool = worker_pool(args.workers)
+        def answer_leased(mentions):
+            # the queue knows which mentions are answered, so nothing to record here
+            answer_all(mentions, api, pool, lambda m: None, cache, args.budget, lambda m: queue.finish(m.lease))
+            export()
+        try:
+            run_consumer(queue, answer_leased, args.workers, args.lease)
+            api.flush()
+        finally:
+            pool.terminate()
+        return
+
+    # The tweets already processed
+    seen = open_seen(args.seen)
+    seen.compact(args.seen_days * 24 * 60 * 60)
+
+    if args.produce:
+        queue = open_queue(args.queue)
+        def queue_batch(mentions):
+            # recorded as seen once queued, so the next poll starts after them
+            mentions = [m for m in mentions if not m.id in seen]
+            print 'queued', enqueue(queue, mentions), 'new mentions'
+            seen.add_many(m.id for m in mentions)
+        if args.daemon:
+            run_daemon(api, queue_batch, seen.since_id, args.min_interval, args.max_interval)
+        else:
+            queue_batch(fetch_mentions(api, seen.since_id, first_count=15))
+        return
+
+    if args.daemon:
+        # load before forking, so the workers share the resources
+        load_resources()
+        pool = worker_pool(args.workers)
+        def answer_batch(mentions):
+            mentions = [m for m in mentions if not m.id in seen]
+            seen.expect(m.id for m in mentions)
+            answer_all(mentions, api, pool, lambda m: seen.add(m.id), cache, args.budget)
+            export()
+        try:
+            run_daemon(api, answer_batch, seen.since_id, args.min_interval, args.max_interval)
+            api.flush()
+        finally:
+            pool.terminate()
+        return
+
+    todo = []    # tweets that need to be processed
 
     print 'checking for queries...'
-    mentions = api.mentions_timeline(count=15) # get tweets to process
+    # every mention since the last one answered, oldest first
+    mentions = fetch_mentions(api, seen.since_id, first_count=15)
     # If we haven't processed / responded to them yet, add it to the queue
     for mention in mentions:
-        if not str(mention.id) in processed_tweets and mention != None:
-            q.put(mention)
+        if not mention.id in seen:
+            todo.append(mention)
 
-    if not q.empty():
+    if todo:
         print '...found some'
     else:
         print '...no new tweets to reply to'
-
-    # Process q
-    while not q.empty():
-        m = q.get()
-        r = Request(m, api)
-        print 'composing poem...'
-        poem = r.get_poem()
-        print '...poem composed:'
-        print poem
-        print 'tweeting back...'
-        api.update_status(poem) # will need to be changed to get_poem or whatever
-        print '...done'
-        done.add(m.id)
-    # Update the seen file
-    seen_file = open('SEEN', 'a')
-    for processed in done:
-        seen_file.write(str(processed) + '\n')
-
-    seen_file.close()
+        return
+
+    # Process todo
+    load_resources()
+    pool = worker_pool(args.workers)
+    # Recorded as each reply goes out, so a crash doesn't answer them again, and until then they hold back since_id, so a
+    # crash or a failed poem doesn't lose them either
+    seen.expect(m.id for m in todo)
+    answer_all(todo, api, pool, lambda m: seen.add(m.id), cache, args.budget)
+    pool.close()
+    pool.join()
+    api.flush()
+    export()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for loading the big lexical resources (the twitter model, dictionaries, indexes) only when they are first used '''
+
+import threading
+
+class Lazy_Resource(object):
+    ''' stands in for a resource until something uses it, then calls loader once and hands every attribute access,
+        lookup, membership test and iteration on to what loader returned
+        safe to share between threads - only one of them will do the loading '''
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.resource = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        ''' returns the resource, loading it first if nothing has used it yet '''
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    print 'loading ' + self.name + '...'
+                    self.resource = self.loader()
+                    self.loaded = True
+                    print '...loaded'
+        return self.resource
+
+    def use(self, resource):
+        ''' makes resource the one used from now on, instead of whatever loader returns - for stand-ins and experiments '''
+        with self.lock:
+            self.resource = resource
+            self.loaded = True
+
+    def __getattr__(self, attr):
+        # only called for attributes that aren't set in __init__ - the check stops copy/pickle, which look up attributes
+        # before __init__ has run, from recursing or loading the resource
+        if attr.startswith('__') or attr in ('name', 'loader', 'resource', 'loaded', 'lock'):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for remembering which mentions have been answered, in an SQLite file, so that checking one is an index lookup,
+    each is saved as soon as it is answered, and the next poll can start after them (since_id)
+    mentions that were fetched but not answered yet (pending) hold since_id back, so the ones a crash or a failed poem left
+    unanswered are fetched again by the next run - up to MAX_ATTEMPTS times, after which they are given up on
+    entries older than a few days are compacted away: mentions that old are below since_id, so twitter won't send them again,
+    and anything at or below the newest compacted id still counts as answered '''
+
+import os, time, sqlite3, threading
+
+MAX_ATTEMPTS = 3 # times a mention is fetched without being answered before since_id moves past it anyway
+
+class Seen_Store(object):
+    ''' the ids of the answered mentions, with when they were answered, in the SQLite file at path '''
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        # replies are recorded from the reply sender thread
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS answered (id INTEGER PRIMARY KEY, time REAL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pending (id INTEGER PRIMARY KEY, attempts INTEGER)')
+
+    def get_state(self, key):
+        row = self.connection.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_state(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (key, value))
+
+    def __contains__(self, mention_id):
+        mention_id = int(mention_id)
+        with self.lock:
+            compacted = self.get_state('compacted_below')
+            if compacted is not None and mention_id <= compacted:
+                return True
+            return self.connection.execute('SELECT 1 FROM answered WHERE id = ?', (mention_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM answered').fetchone()[0]
+
+    def add(self, mention_id):
+        ''' records mention_id as answered, committing right away so a crash doesn't answer it again '''
+        self.add_many([mention_id])
+
+    def add_many(self, mention_ids):
+        mention_ids = [int(mention_id) for mention_id in mention_ids]
+        if not mention_ids:
+            return
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO answered VALUES (?, ?)',
+                                            ((mention_id, now) for mention_id in mention_ids))
+                self.connection.executemany('DELETE FROM pending WHERE id = ?', ((mention_id,) for mention_id in mention_ids))
+                newest = self.get_state('newest')
+                self.set_state('newest', max(mention_ids + ([newest] if newest is not None else [])))
+
+    def expect(self, mention_ids):
+        ''' records that mention_ids were fetched and are about to be answered, so since_id stays below them until they are
+            (or until they have been fetched max_attempts times) '''
+        mention_ids = [int(mention_id) for mention_id in mention_ids]
+        with self.lock:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO pending VALUES (?, 0)',
+                                            ((mention_id,) for mention_id in mention_ids))
+                self.connection.executemany('UPDATE pending SET attempts = attempts + 1 WHERE id = ?',
+                                            ((mention_id,) for mention_id in mention_ids))
+
+    def blocking(self):
+        ''' the oldest pending mention that will be fetched again, or None '''
+        return self.connection.execute('SELECT MIN(id) FROM pending WHERE attempts < ?', (self.max_attempts,)).fetchone()[0]
+
+    @property
+    def since_id(self):
+        ''' for polling only the mentions after it: the newest mention answered, but below any that are still pending, or
+            None if nothing has been answered '''
+        with self.lock:
+            newest = self.get_state('newest')
+            blocking = self.blocking()
+        if newest is None or blocking is None:
+            return newest
+        return min(newest, blocking - 1)
+
+    def compact(self, max_age):
+        ''' forgets the mentions answered more than max_age seconds ago, returning how many there were '''
+        with self.lock:
+            with self.connection:
+                cutoff = time.time() - max_age
+                newest = self.connection.execute('SELECT MAX(id) FROM answered WHERE time < ?', (cutoff,)).fetchone()[0]
+                if newest is None:
+                    return 0
+                # the mentions still pending must not count as answered
+                blocking = self.blocking()
+                if blocking is not None:
+                    newest = min(newest, blocking - 1)
+                compacted = self.get_state('compacted_below')
+                self.set_state('compacted_below', max(newest, compacted))
+                deleted = self.connection.execute('DELETE FROM answered WHERE id <= ?', (newest,)).rowcount
+                self.connection.execute('DELETE FROM pending WHERE id <= ?', (newest,))
+            self.connection.execute('VACUUM')
+        return deleted
+
+    def import_text(self, path):
+        ''' adds the ids in the text file at path (one per line, like the old SEEN file) '''
+        with open(path) as seen_file:
+            self.add_many(line.strip() for line in seen_file if line.strip().isdigit())
+
+def open_seen(path, legacy_path='SEEN'):
+    ''' opens the store at path, filling it from the old SEEN text file the first time '''
+    fresh = not os.path.exists(path)
+    seen = Seen_Store(path)
+    if fresh and os.path.exists(legacy_path):
+        seen.import_text(legacy_path)
+    return seen
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for correcting misspelled words to words we can pronounce, quickly: a symmetric delete index (the idea
+    behind SymSpell) maps every string made by deleting up to max_distance letters from the start of a word to that word,
+    so the candidates for a misspelling are found by looking up its own deletes, and only those are compared letter by
+    letter '''
+
+import cPickle
+
+def edit_distance(word1, word2, max_distance=None):
+    ''' number of insertions, deletions, substitutions and swaps of adjacent letters that turn word1 into word2
+        gives up as soon as it is sure the answer is more than max_distance, returning max_distance + 1 '''
+    if word1 == word2:
+        return 0
+    if max_distance is not None and abs(len(word1) - len(word2)) > max_distance:
+        return max_distance + 1
+    # a common start and end cost nothing
+    start = 0
+    while start < len(word1) and start < len(word2) and word1[start] == word2[start]:
+        start += 1
+    end = 0
+    while end < len(word1) - start and end < len(word2) - start and word1[-1 - end] == word2[-1 - end]:
+        end += 1
+    word1 = word1[start:len(word1) - end]
+    word2 = word2[start:len(word2) - end]
+    if not word1 or not word2:
+        return len(word1) + len(word2)
+    before = None
+    previous = range(len(word2) + 1)
+    for i in range(1, len(word1) + 1):
+        current = [i] + [0] * len(word2)
+        for j in range(1, len(word2) + 1):
+            cost = 0 if word1[i - 1] == word2[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and word1[i - 1] == word2[j - 2] and word1[i - 2] == word2[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return previous[-1]
+
+def deletes(word, max_distance):
+    ''' every string made by deleting at most max_distance letters from word, word included '''
+    return set(string for level in deletes_by_level(word, max_distance) for string in level)
+
+def deletes_by_level(word, max_distance):
+    ''' yields the strings made by deleting letters from word, as lists: the one with no letters deleted (word itself), then
+        those with one letter deleted, and so on up to max_distance - each only worked out when it is asked for '''
+    level = [word]
+    seen = set(level)
+    yield level
+    for distance in range(max_distance):
+        previous, level = level, []
+        for string in previous:
+            for i in range(len(string)):
+                deleted = string[:i] + string[i + 1:]
+                if not deleted in seen:
+                    seen.add(deleted)
+                    level.append(deleted)
+        yield level
+
+class Spelling_Index(object):
+    ''' corrections within max_distance edits among the words of counts (a dict of word to how common it is, which breaks
+        ties between corrections as close as each other)
+        only the first prefix_length letters of each word are indexed, which keeps the index small; candidates are still
+        checked against the whole word '''
+    def __init__(self, counts, max_distance=2, prefix_length=7):
+        self.counts = counts
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        # delete to the word it comes from, or a list of them when there are several - most have only one
+        self.index = {}
+        for word in counts:
+            for deleted in deletes(word[:prefix_length], max_distance):
+                found = self.index.get(deleted)
+                if found is None:
+                    self.index[deleted] = word
+                elif isinstance(found, list):
+                    found.append(word)
+                else:
+                    self.index[deleted] = [found, word]
+
+    def suggest(self, word, max_distance=None):
+        ''' the words within max_distance edits of word, as (word, distance) tuples, closest (then most common) first '''
+        if max_distance is None:
+            max_distance = self.max_distance
+        checked = set()
+        suggestions = []
+        for deleted in deletes(word[:self.prefix_length], max_distance):
+            found = self.index.get(deleted)
+            if found is None:
+                continue
+            for candidate in (found if isinstance(found, list) else [found]):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    suggestions.append((candidate, distance))
+        suggestions.sort(key=lambda suggestion: (suggestion[1], -self.counts[suggestion[0]], suggestion[0]))
+        return suggestions
+
+    def correct(self, word):
+        ''' the first of suggest(word), or None if there is none, found without working out every suggestion: only words
+            as close as the best so far are checked, and a word k edits away is always found by deleting at most k
+            letters from word, so the deletes with more letters gone than that don't need looking up '''
+        best = None
+        best_key = None
+        best_distance = self.max_distance
+        checked = set()
+        for level, strings in enumerate(deletes_by_level(word[:self.prefix_length], self.max_distance)):
+            if level > best_distance:
+                break
+            for deleted in strings:
+                found = self.index.get(deleted)
+                if found is None:
+                    continue
+                for candidate in (found if isinstance(found, list) else [found]):
+                    if candidate in checked:
+                        continue
+                    checked.add(candidate)
+                    distance = edit_distance(word, candidate, best_distance)
+                    if distance > best_distance:
+                        continue
+                    key = (distance, -self.counts[candidate], candidate)
+                    if best is None or key < best_key:
+                        best, best_key, best_distance = candidate, key, distance
+        return best
+
+    def __len__(self):
+        return len(self.counts)
+
+def load_spelling_index(path, build, size):
+    ''' loads the index saved at path, or calls build() and saves what it returns there if the file is missing or was built
+        from a vocabulary of a different size than size (delete the file to force a rebuild) '''
+    try:
+        with open(path, 'rb') as index_file:
+            saved_size, index = cPickle.load(index_file)
+        if saved_size == size:
+            return index
+    except (IOError, EOFError, ValueError, cPickle.UnpicklingError):
+        pass
+    index = build()
+    with open(path, 'wb') as index_file:
+        cPickle.dump((size, index), index_file, cPickle.HIGHEST_PROTOCOL)
+    return index
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for talking to twitter without stalling the bot: every endpoint has a token bucket keeping it under
+    twitter's rate limits, failed calls are retried with backoff, and replies are posted from a queue by a background
+    thread so composing the next poems doesn't wait on them '''
+
+import time, threading, Queue
+from metrics import log, METRICS
+
+# endpoint to (calls allowed, per how many seconds)
+LIMITS = {'mentions_timeline': (75, 15 * 60), 'search': (180, 15 * 60), 'update_status': (300, 3 * 60 * 60)}
+
+class Rate_Limiter(object):
+    ''' token bucket: holds up to capacity tokens, refilled at capacity per window seconds, and every call takes one '''
+    def __init__(self, capacity, window, clock=time.time, sleep=time.sleep):
+        self.capacity = capacity
+        self.rate = capacity / float(window)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ''' takes a token, first waiting for one if the bucket is empty '''
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+def error_status(error):
+    ''' the HTTP status of twitter's answer that error came from, or None if there was no answer (e.g. no connection) '''
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', getattr(response, 'status', None))
+
+def retryable(error):
+    ''' whether trying again might work: after a rate limit (429), a server error (5xx) or no answer at all - anything
+        else, like a status that is too long or a duplicate, will fail the same way every time '''
+    status = error_status(error)
+    return status is None or status == 429 or status >= 500
+
+def rate_limit_wait(error):
+    ''' seconds to wait if error is twitter saying we are over a rate limit (HTTP 429), otherwise None '''
+    if error_status(error) != 429:
+        return None
+    reset = getattr(error.response, 'headers', {}).get('x-rate-limit-reset')
+    if reset:
+        return max(0, float(reset) - time.time()) + 1
+    return 60
+
+class Twitter_Client(object):
+    ''' wraps a tweepy.API (or anything with the same mentions_timeline, search and update_status, like a stand-in for
+        testing), keeping each endpoint under its rate limit and retrying failed calls up to retries times, waiting backoff,
+        then twice that, and so on (or until the limit resets, for 429s) - errors that would only happen again (see retryable)
+        are raised straight away '''
+    def __init__(self, api, limits=LIMITS, retries=3, backoff=2, clock=time.time, sleep=time.sleep):
+        self.api = api
+        self.limiters = dict((endpoint, Rate_Limiter(calls, window, clock, sleep))
+                             for endpoint, (calls, window) in limits.iteritems())
+        self.retries = retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.replies = Queue.Queue() # (status, function to call once it's posted)
+        self.sender = None
+
+    def call(self, endpoint, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            if endpoint in self.limiters:
+                self.limiters[endpoint].acquire()
+            try:
+                with METRICS.span(endpoint):
+                    return getattr(self.api, endpoint)(*args, **kwargs)
+            except Exception, e:
+                if attempt == self.retries or not retryable(e):
+                    raise
+                wait = rate_limit_wait(e)
+                if wait is not None:
+                    METRICS.count('rate_limited')
+                else:
+                    METRICS.count('retries')
+                    wait = self.backoff * 2 ** attempt
+                log(endpoint + ' failed (' + str(e) + '), trying again in ' + str(wait) + ' s')
+                self.sleep(wait)
+
+    def mentions_timeline(self, *args, **kwargs):
+        return self.call('mentions_timeline', *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.call('search', *args, **kwargs)
+
+    def update_status(self, *args, **kwargs):
+        return self.call('update_status', *args, **kwargs)
+
+    def reply(self, status, sent=None):
+        ''' queues status to be posted by the sender thread, which then calls sent() - replies are posted in the order they
+            were queued '''
+        if self.sender is None:
+            self.sender = threading.Thread(target=self.send_replies)
+            self.sender.daemon = True
+            self.sender.start()
+        self.replies.put((status, sent))
+
+    def send_replies(self):
+        while True:
+            status, sent = self.replies.get()
+            try:
+                self.update_status(status)
+                if sent is not None:
+                    sent()
+            except Exception, e:
+                print 'failed to post reply:', str(e)
+                METRICS.count('replies_failed')
+            finally:
+                self.replies.task_done()
+
+    def flush(self):
+        ''' waits until every queued reply has been posted (or has failed) '''
+        self.replies.join()
+
+# ---- stand-ins for tweepy's statuses, for running the bot without twitter ----
+
+class Fake_Status(object):
+    ''' stands in for a tweet (a mention or a search result) with the parts of one the bot uses '''
+    def __init__(self, tweet_id, text, screen_name=None):
+        self.id = tweet_id
+        self.text = text
+        self.author = Fake_Author(screen_name)
+
+class Fake_Author(object):
+    def __init__(self, screen_name):
+        self.screen_name = screen_name
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+''' This file is for storing the word2vec twitter model in a form that can be memory-mapped, so that loading it is nearly instant
+    and every process using it shares the same pages through the OS page cache
+
+    run "python vectors.py" once to convert ../corpus preparation/prof_corpus.bin
+    then "python vectors.py -shrink int8" (or float16) makes a smaller copy, keeping only the words that can be pronounced
+    and the most frequent others (the slang normalize_word looks up), which load_model uses instead when it exists '''
+
+import os, random, argparse
+import collections
+import numpy
+from ann import IVF_Index
+
+# same fields as gensim's vocab entries, so TWITTER_MODEL.vocab[word].index works for both kinds of model
+Vocab = collections.namedtuple('Vocab', 'index count')
+
+MODEL_PATH = '../corpus preparation/prof_corpus.bin'
+MAPPED_MODEL_PATH = '../corpus preparation/prof_corpus' # .npy holds the unit vectors, .vocab the words in row order
+SMALL_MODEL_PATH = '../corpus preparation/prof_corpus_small' # same, shrunk by shrink_model (.scale.npy too for int8)
+CHUNK = 65536 # rows of vectors converted at once, to bound the memory used
+
+def convert_model(bin_path, prefix):
+    ''' loads the word2vec binary at bin_path with gensim and writes its unit-length vectors to prefix.npy and its vocabulary
+        ("word count" per line, in row order) to prefix.vocab '''
+    import gensim
+    model = gensim.models.Word2Vec.load_word2vec_format(bin_path, binary=True)
+    model.init_sims()
+    numpy.save(prefix + '.npy', model.syn0norm)
+    write_vocab(prefix + '.vocab', model.index2word, [model.vocab[word].count for word in model.index2word])
+
+def dot_rows(vectors, vector):
+    ''' vectors.dot(vector), a chunk of rows at a time, so reduced-precision vectors aren't all converted at once '''
+    dists = numpy.empty(len(vectors), dtype=numpy.float32)
+    for start in range(0, len(vectors), CHUNK):
+        dists[start:start + CHUNK] = numpy.asarray(vectors[start:start + CHUNK], dtype=numpy.float32).dot(vector)
+    return dists
+
+def write_vocab(path, words, counts):
+    with open(path, 'w') as vocab_file:
+        for word, count in zip(words, counts):
+            vocab_file.write(word.encode('utf-8') + ' ' + str(count) + '\n')
+
+def shrink_model(model, prefix, keep, precision='float16'):
+    ''' writes the vectors of the words of model for which keep(word) is true to prefix.npy and prefix.vocab, like
+        convert_model, but stored as float16 or as int8 - each row scaled so its largest value is 127, with the scales in
+        prefix.scale.npy '''
+    rows = [i for i, word in enumerate(model.index2word) if keep(word)]
+    words = [model.index2word[i] for i in rows]
+    vectors = model.syn0norm
+    if precision == 'float16':
+        codes = numpy.empty((len(rows), vectors.shape[1]), dtype=numpy.float16)
+    else:
+        codes = numpy.empty((len(rows), vectors.shape[1]), dtype=numpy.int8)
+        scales = numpy.empty(len(rows), dtype=numpy.float32)
+    for start in range(0, len(rows), CHUNK):
+        chunk = numpy.asarray(vectors[rows[start:start + CHUNK]], dtype=numpy.float32)
+        if precision == 'float16':
+            codes[start:start + CHUNK] = chunk
+        else:
+            chunk_scales = numpy.abs(chunk).max(axis=1) / 127
+            chunk_scales[chunk_scales == 0] = 1
+            codes[start:start + CHUNK] = numpy.round(chunk / chunk_scales[:, None])
+            scales[start:start + CHUNK] = chunk_scales
+    numpy.save(prefix + '.npy', codes)
+    if precision != 'float16':
+        numpy.save(prefix + '.scale.npy', scales)
+    elif os.path.exists(prefix + '.scale.npy'):
+        os.remove(prefix + '.scale.npy')
+    write_vocab(prefix + '.vocab', words, [model.vocab[word].count for word in words])
+
+def drift(full, small, samples=2000, topn=10, seed=0):
+    ''' how far the similarities of the shrunk model "small" are from those of the full model, over random pairs of the
+        words they share, and how many of the full model's topn most similar words it still finds, on average '''
+    rng = random.Random(seed)
+    words = small.index2word
+    errors = []
+    for i in range(samples):
+        word1, word2 = rng.choice(words), rng.choice(words)
+        errors.append(abs(full.similarity(word1, word2) - small.similarity(word1, word2)))
+    found = 0
+    sample = [rng.choice(words) for i in range(min(100, samples))]
+    for word in sample:
+        # only the shared words can be found by both
+        exact = [w for w, dist in full.most_similar(word, topn * 5, exact=True) if w in small.vocab][:topn]
+        found += len(set(exact) & set(w for w, dist in small.most_similar(word, topn, exact=True)))
+    return {'mean_error': float(numpy.mean(errors)), 'max_error': float(numpy.max(errors)),
+            'recall': found / float(max(1, topn * len(sample)))}
+
+class Quantized_Vectors(object):
+    ''' int8 codes and a scale per row, read like the float matrix they stand for: indexing returns float32 rows '''
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.shape = codes.shape
+        self.nbytes = codes.nbytes + scales.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        codes = numpy.asarray(self.codes[key], dtype=numpy.float32)
+        scales = self.scales[key]
+        return codes * (scales[..., None] if numpy.ndim(scales) else scales)
+
+    def dot(self, vector):
+        return dot_rows(self, vector)
+
+class Mapped_Model(object):
+    ''' the parts of gensim's Word2Vec used by the bot, over vectors memory-mapped from a file written by convert_model (or
+        shrink_model, in which case syn0norm holds float16 or Quantized_Vectors and everything works the same)
+        the vectors are already unit length, so model[word] is the same as gensim's model.syn0norm[index]
+        most_similar uses the approximate index "ann" (see ann.py) when there is one '''
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.syn0norm = numpy.load(prefix + '.npy', mmap_mode='r')
+        if os.path.exists(prefix + '.scale.npy'):
+            self.syn0norm = Quantized_Vectors(self.syn0norm, numpy.load(prefix + '.scale.npy', mmap_mode='r'))
+        self.ann = None
+        self.index2word = []
+        self.vocab = {}
+        with open(prefix + '.vocab') as vocab_file:
+            for line in vocab_file:
+                word, count = line.rstrip('\n').rsplit(' ', 1)
+                word = word.decode('utf-8')
+                self.vocab[word] = Vocab(len(self.index2word), int(count))
+                self.index2word.append(word)
+
+    def init_sims(self):
+        ''' nothing to do, the stored vectors are normalized - kept so callers don't need to know which model they have '''
+        pass
+
+    def __getitem__(self, word):
+        return self.syn0norm[self.vocab[word].index]
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+    def similarity(self, word1, word2):
+        ''' cosine similarity of word1 and word2, raises KeyError if either is not in the vocabulary '''
+        return float(numpy.dot(numpy.asarray(self[word1], dtype=numpy.float32), self[word2]))
+
+    def most_similar(self, positive, topn=10, exact=False):
+        ''' the topn words closest to the mean of the words in positive (one word or a list of them), as (word, similarity)
+            tuples, most similar first, like gensim '''
+        if isinstance(positive, basestring):
+            positive = [positive]
+        mean = numpy.mean([self[word] for word in positive], axis=0, dtype=numpy.float32)
+        mean /= numpy.linalg.norm(mean)
+        return self.nearest(mean, topn, exclude=positive, exact=exact)
+
+    def nearest(self, vector, topn, exclude=(), exact=False):
+        ''' the topn words closest to the unit vector "vector", found with the approximate index if there is one, otherwise
+            (or if exact is True) by brute force search of the whole vocabulary '''
+        count = min(topn + len(exclude), len(self.index2word))
+        if self.ann is not None and not exact:
+            best, dists = self.ann.search(self.syn0norm, vector, count)
+        else:
+            dists = dot_rows(self.syn0norm, vector)
+            best = numpy.argpartition(-dists, count - 1)[:count]
+            best = best[numpy.argsort(-dists[best])]
+            dists = dists[best]
+        result = [(self.index2word[i], float(dist)) for i, dist in zip(best, dists) if self.index2word[i] not in exclude]
+        return result[:topn]
+
+def load_model(bin_path=MODEL_PATH, prefixes=(SMALL_MODEL_PATH, MAPPED_MODEL_PATH)):
+    ''' opens the first memory-mapped model in prefixes that has been written, otherwise loads the full binary with gensim '''
+    for prefix in prefixes:
+        if os.path.exists(prefix + '.npy') and os.path.exists(prefix + '.vocab'):
+            model = Mapped_Model(prefix)
+            if os.path.exists(prefix + '.ivf.npz'):
+                model.ann = IVF_Index.load(prefix + '.ivf.npz')
+            return model
+    import gensim
+    return gensim.models.Word2Vec.load_word2vec_format(bin_path, binary=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-shrink', type=str, choices=['float16', 'int8'], help='make the smaller copy of the converted model')
+    parser.add_argument('-slang', type=int, default=50000, help='most frequent words that can\'t be pronounced to keep too')
+    args = parser.parse_args()
+
+    if not args.shrink:
+        print 'converting ' + MODEL_PATH + '...'
+        convert_model(MODEL_PATH, MAPPED_MODEL_PATH)
+        print '...written to ' + MAPPED_MODEL_PATH + '.npy and ' + MAPPED_MODEL_PATH + '.vocab'
+        return
+
+    from linguistics import PHONE_DICT
+    full = Mapped_Model(MAPPED_MODEL_PATH)
+    # index2word is most frequent first
+    slang = set(word for word in full.index2word[:args.slang])
+    print 'shrinking ' + MAPPED_MODEL_PATH + ' to ' + args.shrink + '...'
+    shrink_model(full, SMALL_MODEL_PATH, lambda word: word in PHONE_DICT or word in slang, args.shrink)
+    small = Mapped_Model(SMALL_MODEL_PATH)
+    print '...written to ' + SMALL_MODEL_PATH + '.npy'
+    print '%d of %d words kept, %.1f MB instead of %.1f MB' % (len(small.index2word), len(full.index2word),
+        small.syn0norm.nbytes / 1e6, full.syn0norm.nbytes / 1e6)
+    print 'similarity drift: %(mean_error).5f on average, %(max_error).5f at most, recall of the 10 most similar %(recall).3f' % \
+        drift(full, small)
+
+if __name__ == '__main__':
+    main()